@@ -1,46 +1,230 @@
 import base64
 import hashlib
+from functools import lru_cache
 from Crypto.Cipher import AES
 from Crypto import Random
 
+from instrument import instrumented
+
 # Constants
 BLOCK_SIZE = 16
+SALT_SIZE = 16
+NONCE_SIZE = 12  # AES-GCM nonce
+TAG_SIZE = 16  # AES-GCM authentication tag
+
+# Key derivation functions
+KDF_SHA256 = "sha256"  # Single unsalted SHA-256 of the password (original scheme)
+KDF_PBKDF2 = "pbkdf2"  # PBKDF2-HMAC-SHA256
+KDF_SCRYPT = "scrypt"
+KDFS = (KDF_SHA256, KDF_PBKDF2, KDF_SCRYPT)
+PBKDF2_ITERATIONS = 200000
+SCRYPT_N, SCRYPT_R, SCRYPT_P = 2 ** 14, 8, 1
 
-# Padding function for AES
-def pad(s):
-    return s + (BLOCK_SIZE - len(s) % BLOCK_SIZE) * chr(BLOCK_SIZE - len(s) % BLOCK_SIZE)
+# Derived keys kept in memory; a batch run reusing one password derives it once
+KEY_CACHE_SIZE = 128
 
-# Unpadding function for AES
-def unpad(s):
-    return s[:-ord(s[len(s) - 1:])]
+# Function to derive a 32-byte key from a password, cached per password, KDF and parameters
+# (only actual derivations are recorded as a stage, not cache hits)
+@lru_cache(maxsize=KEY_CACHE_SIZE)
+@instrumented("key derivation")
+def derive_key(password, kdf=KDF_SHA256, salt=b"", iterations=PBKDF2_ITERATIONS):
+    password_bytes = password.encode("utf-8")
+    if kdf == KDF_SHA256:
+        return hashlib.sha256(password_bytes).digest()
+    if kdf == KDF_PBKDF2:
+        return hashlib.pbkdf2_hmac("sha256", password_bytes, salt, iterations)
+    if kdf == KDF_SCRYPT:
+        return hashlib.scrypt(password_bytes, salt=salt, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P, dklen=32)
+    raise ValueError(f"Unknown key derivation function: {kdf}")
 
 # Function to generate a private key from a password
 def get_private_key(password):
     # Use SHA-256 to hash the password to create a 32-byte key
-    return hashlib.sha256(password.encode("utf-8")).digest()
+    return derive_key(password)
+
+# PKCS#7 padding for byte strings
+def pad_bytes(data):
+    count = BLOCK_SIZE - len(data) % BLOCK_SIZE
+    return data + bytes([count]) * count
+
+# PKCS#7 unpadding for byte strings
+def unpad_bytes(data):
+    count = data[-1] if data else 0
+    if not 1 <= count <= BLOCK_SIZE or data[-count:] != bytes([count]) * count:
+        raise ValueError("Decryption failed: Invalid key or corrupted ciphertext.")
+    return data[:-count]
 
-# Function to encrypt data using AES
-def encrypt(raw, password):
-    private_key = get_private_key(password)
-    raw = pad(raw)
+# Salt written in front of the output for a salted KDF (none for SHA-256)
+# Pass the same salt for a whole batch so the (slow) derivation is paid once
+# per password, not per message.
+def _salt_for(kdf, salt=None):
+    if kdf == KDF_SHA256:
+        return b""
+    salt = salt or Random.new().read(SALT_SIZE)
+    if len(salt) != SALT_SIZE:
+        raise ValueError(f"Salt must be {SALT_SIZE} bytes long.")
+    return salt
+
+def _salt_size(kdf):
+    return 0 if kdf == KDF_SHA256 else SALT_SIZE
+
+# Fresh random salt for a KDF (empty for SHA-256). Generate one per batch or
+# session and pass it to every encryption, so the key is derived once per
+# password rather than once per message.
+def new_salt(kdf=KDF_SHA256):
+    return _salt_for(kdf)
+
+# Function to encrypt bytes using AES, returning raw bytes (salt + IV + ciphertext)
+@instrumented("encrypt")
+def encrypt_bytes(data, password, kdf=KDF_SHA256, salt=None):
+    prefix = _salt_for(kdf, salt)
+    private_key = derive_key(password, kdf, prefix)
     iv = Random.new().read(AES.block_size)
+    # CBC cipher objects carry per-message IV state, so one is built per call
+    cipher = AES.new(private_key, AES.MODE_CBC, iv)
+    return prefix + iv + cipher.encrypt(pad_bytes(data))
+
+# Function to decrypt the raw bytes produced by encrypt_bytes
+@instrumented("decrypt")
+def decrypt_bytes(enc, password, kdf=KDF_SHA256):
+    salt = b""
+    if kdf != KDF_SHA256:
+        salt, enc = enc[:SALT_SIZE], enc[SALT_SIZE:]
+    private_key = derive_key(password, kdf, salt)
+
+    if len(enc) < 2 * BLOCK_SIZE or len(enc) % BLOCK_SIZE:
+        raise ValueError("Invalid encrypted message.")
+
+    iv = enc[:16]
     cipher = AES.new(private_key, AES.MODE_CBC, iv)
-    encrypted = iv + cipher.encrypt(raw.encode('utf-8'))
-    return base64.b64encode(encrypted)
+    return unpad_bytes(cipher.decrypt(enc[16:]))
+
+# Function to encrypt and authenticate bytes in one pass with AES-GCM
+# Returns salt + nonce + ciphertext + 16-byte tag; associated_data is
+# authenticated but not stored, so it must be supplied again to decrypt.
+@instrumented("encrypt")
+def encrypt_gcm(data, password, associated_data=b"", kdf=KDF_SHA256, salt=None):
+    prefix = _salt_for(kdf, salt)
+    nonce = Random.new().read(NONCE_SIZE)
+    cipher = AES.new(derive_key(password, kdf, prefix), AES.MODE_GCM, nonce=nonce, mac_len=TAG_SIZE)
+    cipher.update(associated_data)
+    ciphertext, tag = cipher.encrypt_and_digest(data)
+    return prefix + nonce + ciphertext + tag
+
+# Function to verify and decrypt the bytes produced by encrypt_gcm
+@instrumented("decrypt")
+def decrypt_gcm(enc, password, associated_data=b"", kdf=KDF_SHA256):
+    salt = b""
+    if kdf != KDF_SHA256:
+        salt, enc = enc[:SALT_SIZE], enc[SALT_SIZE:]
+    if len(enc) < NONCE_SIZE + TAG_SIZE:
+        raise ValueError("Invalid encrypted message.")
 
-# Function to decrypt data using AES
-def decrypt(enc, password):
-    private_key = get_private_key(password)
+    nonce, ciphertext, tag = enc[:NONCE_SIZE], enc[NONCE_SIZE:-TAG_SIZE], enc[-TAG_SIZE:]
+    cipher = AES.new(derive_key(password, kdf, salt), AES.MODE_GCM, nonce=nonce, mac_len=TAG_SIZE)
+    cipher.update(associated_data)
+    try:
+        return cipher.decrypt_and_verify(ciphertext, tag)
+    except ValueError:
+        raise ValueError("Authentication failed: The message has been tampered with or a key is incorrect.")
+
+# Output lengths for a plaintext length, so a streamed payload can be sized up front
+def gcm_length(length, kdf=KDF_SHA256):
+    return _salt_size(kdf) + NONCE_SIZE + length + TAG_SIZE
+
+def cbc_length(length, kdf=KDF_SHA256):
+    return _salt_size(kdf) + BLOCK_SIZE + (length // BLOCK_SIZE + 1) * BLOCK_SIZE
+
+# Chunked AES-GCM over an iterable of byte strings (e.g. a file read piece by
+# piece): yields salt + nonce, the ciphertext chunks, then the tag. Only one
+# chunk is in memory at a time; the output matches encrypt_gcm.
+def encrypt_gcm_stream(chunks, password, associated_data=b"", kdf=KDF_SHA256, salt=None):
+    prefix = _salt_for(kdf, salt)
+    nonce = Random.new().read(NONCE_SIZE)
+    cipher = AES.new(derive_key(password, kdf, prefix), AES.MODE_GCM, nonce=nonce, mac_len=TAG_SIZE)
+    cipher.update(associated_data)
+    yield prefix + nonce
+    for chunk in chunks:
+        yield cipher.encrypt(chunk)
+    yield cipher.digest()
+
+# Chunked inverse of encrypt_gcm_stream. Plaintext is yielded before the tag
+# is checked at the end of the stream, so discard the output if it raises.
+def decrypt_gcm_stream(chunks, password, associated_data=b"", kdf=KDF_SHA256):
+    head_size = _salt_size(kdf) + NONCE_SIZE
+    buffer = bytearray()
+    cipher = None
+    for chunk in chunks:
+        buffer += chunk
+        if cipher is None:
+            if len(buffer) < head_size:
+                continue
+            salt, nonce = bytes(buffer[:head_size - NONCE_SIZE]), bytes(buffer[head_size - NONCE_SIZE:head_size])
+            del buffer[:head_size]
+            cipher = AES.new(derive_key(password, kdf, salt), AES.MODE_GCM, nonce=nonce, mac_len=TAG_SIZE)
+            cipher.update(associated_data)
+        # The last TAG_SIZE bytes seen so far may be the tag, so hold them back
+        if len(buffer) > TAG_SIZE:
+            yield cipher.decrypt(bytes(buffer[:-TAG_SIZE]))
+            del buffer[:-TAG_SIZE]
+    if cipher is None or len(buffer) < TAG_SIZE:
+        raise ValueError("Invalid encrypted message.")
+    try:
+        cipher.verify(bytes(buffer))
+    except ValueError:
+        raise ValueError("Authentication failed: The message has been tampered with or a key is incorrect.")
+
+# Chunked AES-CBC with PKCS#7 padding; the output matches encrypt_bytes
+def encrypt_cbc_stream(chunks, password, kdf=KDF_SHA256, salt=None):
+    prefix = _salt_for(kdf, salt)
+    iv = Random.new().read(AES.block_size)
+    cipher = AES.new(derive_key(password, kdf, prefix), AES.MODE_CBC, iv)
+    yield prefix + iv
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += chunk
+        whole = len(buffer) - len(buffer) % BLOCK_SIZE
+        if whole:
+            yield cipher.encrypt(bytes(buffer[:whole]))
+            del buffer[:whole]
+    yield cipher.encrypt(pad_bytes(bytes(buffer)))
+
+# Chunked inverse of encrypt_cbc_stream; the last block is held back for unpadding
+def decrypt_cbc_stream(chunks, password, kdf=KDF_SHA256):
+    head_size = _salt_size(kdf) + BLOCK_SIZE
+    buffer = bytearray()
+    cipher = None
+    for chunk in chunks:
+        buffer += chunk
+        if cipher is None:
+            if len(buffer) < head_size:
+                continue
+            salt, iv = bytes(buffer[:head_size - BLOCK_SIZE]), bytes(buffer[head_size - BLOCK_SIZE:head_size])
+            del buffer[:head_size]
+            cipher = AES.new(derive_key(password, kdf, salt), AES.MODE_CBC, iv)
+        whole = (len(buffer) - 1) // BLOCK_SIZE * BLOCK_SIZE
+        if whole > 0:
+            yield cipher.decrypt(bytes(buffer[:whole]))
+            del buffer[:whole]
+    if cipher is None or len(buffer) != BLOCK_SIZE:
+        raise ValueError("Invalid encrypted message.")
+    yield unpad_bytes(cipher.decrypt(bytes(buffer)))
+
+# Function to encrypt text using AES, returning base64 text
+# PKCS#7 over the UTF-8 bytes matches the old character padding for ASCII
+# and also handles multi-byte characters correctly.
+def encrypt(raw, password, kdf=KDF_SHA256, salt=None):
+    return base64.b64encode(encrypt_bytes(raw.encode('utf-8'), password, kdf, salt))
+
+# Function to decrypt base64 text produced by encrypt
+def decrypt(enc, password, kdf=KDF_SHA256):
     enc = base64.b64decode(enc)
     
     if len(enc) < 16:
         raise ValueError("Invalid encrypted message.")
     
-    iv = enc[:16]
-    cipher = AES.new(private_key, AES.MODE_CBC, iv)
-    
     try:
-        decrypted = unpad(cipher.decrypt(enc[16:])).decode('utf-8')
+        decrypted = decrypt_bytes(enc, password, kdf).decode('utf-8')
         return decrypted
     except Exception as e:
         raise ValueError("Decryption failed: Invalid key or corrupted ciphertext.")
\ No newline at end of file
@@ -0,0 +1,145 @@
+# async_stego.py - asyncio facade over the blocking encode/decode pipeline
+import argparse
+import asyncio
+import io
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from compression import COMPRESSION_NONE
+from decode_lsb import decode_payload
+from encode_lsb import encode_payload
+from envelope import CIPHER_GCM, open_sealed, seal
+
+def _source(image):
+    """Return something PIL can open: a path as is, raw bytes wrapped in a buffer."""
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return io.BytesIO(image)
+    return image
+
+def embed_bytes(image, message, aes_key, hmac_key, cipher=CIPHER_GCM, compression=COMPRESSION_NONE,
+                channels=None, depth=1, scatter=False, compress_level=6):
+    """Blocking embed: seals message bytes into an image (path or bytes) and returns the stego PNG as bytes.
+
+    PNG compression is most of the cost for small messages; a lower
+    compress_level trades response size for throughput.
+    """
+    flags, fields = seal(message, aes_key, hmac_key, cipher, compression)
+    encoded_img = encode_payload(_source(image), fields, flags=flags, channels=channels, depth=depth,
+                                 scatter_key=hmac_key if scatter else None)
+    buffer = io.BytesIO()
+    encoded_img.save(buffer, format="PNG", compress_level=compress_level)
+    return buffer.getvalue()
+
+def extract_bytes(image, aes_key, hmac_key):
+    """Blocking extract: verifies and decrypts the payload of an image (path or bytes); returns the message bytes."""
+    flags, fields = decode_payload(_source(image), scatter_key=hmac_key)
+    return open_sealed(flags, fields, aes_key, hmac_key)
+
+class AsyncStego:
+    """Runs embed/extract off the event loop with a bounded number of jobs in flight.
+
+    executor is any concurrent.futures executor; None uses the loop's default
+    thread pool. A ProcessPoolExecutor sidesteps the GIL for the pure-Python
+    parts, at the cost of pickling each image. At most max_concurrent jobs
+    are handed to the executor at once (default: CPU count); the rest wait on
+    a semaphore, so a burst of requests or one huge image cannot tie up every
+    worker and the memory of every queued image.
+    """
+
+    def __init__(self, executor=None, max_concurrent=None):
+        self.executor = executor
+        self.max_concurrent = max_concurrent or os.cpu_count() or 1
+        self._semaphore = self._loop = None
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        # A semaphore belongs to one event loop, so make a new one if the instance is reused under another
+        if self._loop is not loop:
+            self._semaphore, self._loop = asyncio.Semaphore(self.max_concurrent), loop
+        async with self._semaphore:
+            return await loop.run_in_executor(self.executor, func, *args)
+
+    async def _read(self, source):
+        """Reads file-like sources in a worker thread; paths and bytes pass through."""
+        if hasattr(source, "read"):
+            return await asyncio.to_thread(source.read)
+        return source
+
+    async def embed(self, image, message, aes_key, hmac_key, cipher=CIPHER_GCM, compression=COMPRESSION_NONE,
+                    channels=None, depth=1, scatter=False, compress_level=6):
+        """Hides message (str, bytes or a binary file object) in image (path, bytes or file object).
+
+        Returns the stego image as PNG bytes.
+        """
+        image, message = await self._read(image), await self._read(message)
+        if isinstance(message, str):
+            message = message.encode("utf-8")
+        return await self._run(embed_bytes, image, message, aes_key, hmac_key, cipher, compression, channels,
+                               depth, scatter, compress_level)
+
+    async def extract(self, image, aes_key, hmac_key):
+        """Returns the verified, decrypted message bytes hidden in image (path, bytes or file object)."""
+        return await self._run(extract_bytes, await self._read(image), aes_key, hmac_key)
+
+_default = AsyncStego()
+
+async def embed(image, message, aes_key, hmac_key, **options):
+    """AsyncStego.embed on the default thread pool and concurrency limit."""
+    return await _default.embed(image, message, aes_key, hmac_key, **options)
+
+async def extract(image, aes_key, hmac_key):
+    """AsyncStego.extract on the default thread pool and concurrency limit."""
+    return await _default.extract(image, aes_key, hmac_key)
+
+async def _heartbeat(lags, interval=0.01):
+    """Records how late the event loop wakes up, to show it is never blocked."""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lags.append(loop.time() - expected)
+
+async def _throughput(stego, cover, requests, message_size, compress_level, aes_key, hmac_key):
+    messages = [os.urandom(message_size) for _ in range(requests)]
+    lags = []
+    heartbeat = asyncio.create_task(_heartbeat(lags))
+
+    start = time.perf_counter()
+    stego_images = await asyncio.gather(*(stego.embed(cover, m, aes_key, hmac_key, compress_level=compress_level) for m in messages))
+    embedded = time.perf_counter() - start
+
+    start = time.perf_counter()
+    decoded = await asyncio.gather(*(stego.extract(image, aes_key, hmac_key) for image in stego_images))
+    extracted = time.perf_counter() - start
+
+    heartbeat.cancel()
+    if decoded != messages:
+        raise ValueError("A round-tripped message did not match.")
+    print(f"embed:   {requests} requests in {embedded:.2f} s ({requests / embedded:.1f} req/s)")
+    print(f"extract: {requests} requests in {extracted:.2f} s ({requests / extracted:.1f} req/s)")
+    print(f"event loop lag: max {max(lags, default=0) * 1000:.1f} ms over {len(lags)} ticks")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Throughput of many concurrent small embed/extract requests.")
+    parser.add_argument("--cover", required=True, help="Cover image.")
+    parser.add_argument("--requests", type=int, default=200, help="Concurrent requests per phase.")
+    parser.add_argument("--message-size", type=int, default=256, help="Bytes per message.")
+    parser.add_argument("--compress-level", type=int, default=6, choices=range(10), help="PNG compression level.")
+    parser.add_argument("--max-concurrent", type=int, help="Jobs in flight (default: CPU count).")
+    parser.add_argument("--processes", action="store_true", help="Use a process pool instead of threads.")
+    args = parser.parse_args(argv)
+
+    with open(args.cover, "rb") as f:
+        cover = f.read()
+    executor = ProcessPoolExecutor() if args.processes else None
+    try:
+        stego = AsyncStego(executor, args.max_concurrent)
+        asyncio.run(_throughput(stego, cover, args.requests, args.message_size, args.compress_level,
+                                "Sixteen byte key", "DemoHMACKey-1-ForTestingPurposes"))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+import csv
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from aes import KDF_SHA256, new_salt
+from capacity import plan
+from compression import COMPRESSION_NONE
+from decode_lsb import decode_payload
+from encode_lsb import encode_payload, encode_payload_streamed
+from envelope import CIPHER_GCM, open_sealed, seal
+from image_probe import probe_image
+from instrument import Profile, stage
+from quality_metrics import compare_arrays, load_rgb, pixel_diff, quality_label
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff")
+
+def find_images(directory):
+    """Return the image files in a directory tree, sorted by path."""
+    found = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                found.append(os.path.join(root, name))
+    return sorted(found)
+
+def read_manifest(manifest_path):
+    """Read encode jobs from a CSV manifest with image, payload and optional output and compression columns.
+
+    Relative paths are resolved against the manifest's directory. An empty
+    compression cell uses the batch-wide setting.
+    """
+    base = os.path.dirname(os.path.abspath(manifest_path))
+    jobs = []
+    with open(manifest_path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            if not row.get("image") or not row.get("payload"):
+                raise ValueError(f"Manifest row is missing an image or payload: {row}")
+            jobs.append({
+                "image": os.path.join(base, row["image"]),
+                "payload": os.path.join(base, row["payload"]),
+                "output": os.path.join(base, row["output"]) if row.get("output") else None,
+                "compression": row.get("compression") or None,
+            })
+    return jobs
+
+def read_pairs(manifest_path):
+    """Read (original, stego) image pairs from a CSV manifest with original and stego columns.
+
+    Relative paths are resolved against the manifest's directory.
+    """
+    base = os.path.dirname(os.path.abspath(manifest_path))
+    pairs = []
+    with open(manifest_path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            if not row.get("original") or not row.get("stego"):
+                raise ValueError(f"Manifest row is missing an original or stego image: {row}")
+            pairs.append((os.path.join(base, row["original"]), os.path.join(base, row["stego"])))
+    return pairs
+
+def output_path_for(image_path, output_dir, input_dir=None):
+    """Return where the stego copy of an image is written (always lossless PNG).
+
+    Images under input_dir keep their path relative to it, so same-named
+    images in different subfolders do not overwrite each other; others are
+    written directly in output_dir.
+    """
+    name = os.path.basename(image_path)
+    if input_dir is not None:
+        relative = os.path.relpath(image_path, input_dir)
+        if relative.split(os.sep)[0] != os.pardir:
+            name = relative
+    return os.path.join(output_dir, os.path.splitext(name)[0] + ".png")
+
+def _claim_outputs(jobs):
+    """Return the jobs, with those that would write to the same output path marked as conflicts.
+
+    E.g. x.jpg and x.png in one folder both map to x.png; the workers would
+    otherwise overwrite each other's file at the same time.
+    """
+    claims = {}
+    for job in jobs:
+        claims.setdefault(os.path.normcase(os.path.abspath(job["output"])), []).append(job["image"])
+    marked = []
+    for job in jobs:
+        images = claims[os.path.normcase(os.path.abspath(job["output"]))]
+        if len(images) > 1:
+            others = ", ".join(image for image in images if image != job["image"]) or job["image"]
+            job = dict(job, conflict=f"Output {job['output']} would also be written for {others}.")
+        marked.append(job)
+    return marked
+
+def _recorded(result, recorded, profile):
+    """Store a job's wall seconds per stage in its result, and the full profile when one was asked for."""
+    result["timings"] = recorded.walls()
+    if profile:
+        result["profile"] = recorded.as_dict()
+    return result
+
+def encode_job(job, aes_key, hmac_key, channels=None, depth=1, stream=False, scatter=False, cipher=CIPHER_GCM,
+               compression=COMPRESSION_NONE, kdf=KDF_SHA256, salt=None, profile=False):
+    """Encrypt, authenticate and embed one payload; runs inside a worker process.
+
+    With stream=True the stego PNG is written strip by strip while embedding,
+    so its "embed and save" stage covers both. With scatter=True the payload
+    pixels follow an order keyed by the HMAC key. cipher selects AES-GCM or
+    AES-CBC + HMAC (see envelope.py). compression is applied before
+    encryption unless the job names its own. kdf and salt select the key
+    derivation (see envelope.seal).
+
+    Uncompressed jobs that cannot fit are rejected from the image header
+    alone, before any pixel or crypto work. The stages are recorded with an
+    instrument.Profile; profile=True also traces memory and stores the full
+    profile in the result.
+    """
+    result = {"image": job["image"], "output": job["output"], "status": "ok"}
+    with Profile(memory=profile) as recorded:
+        try:
+            if job.get("conflict"):
+                raise ValueError(job["conflict"])
+            if job.get("message") is not None:
+                message = job["message"]
+            else:
+                with open(job["payload"], encoding="utf-8") as f:
+                    message = f.read()
+            message = message.encode("utf-8")
+            compression = job.get("compression") or compression
+
+            # Compression can only shrink the payload, so only uncompressed jobs are rejected up front
+            if compression == COMPRESSION_NONE:
+                info = probe_image(job["image"])
+                capacity = plan(info.width, info.height, len(message), channels, depth, cipher,
+                                info.channel_count, len(aes_key.encode("utf-8")), kdf=kdf)
+                if not capacity.fits:
+                    raise ValueError(f"Message is too large to fit in the image: the payload needs "
+                                     f"{capacity.payload_bytes} bytes but the image holds "
+                                     f"{capacity.capacity_bytes}.")
+
+            flags, fields = seal(message, aes_key, hmac_key, cipher, compression, kdf, salt)
+            os.makedirs(os.path.dirname(os.path.abspath(job["output"])), exist_ok=True)
+
+            scatter_key = hmac_key if scatter else None
+            if stream:
+                encode_payload_streamed(job["image"], fields, job["output"], flags=flags, channels=channels,
+                                        depth=depth, scatter_key=scatter_key)
+            else:
+                encoded_img = encode_payload(job["image"], fields, flags=flags, channels=channels, depth=depth,
+                                             scatter_key=scatter_key)
+                with stage("save"):
+                    encoded_img.save(job["output"], format="PNG")
+        except Exception as e:
+            result["status"] = "error"
+            result["error"] = str(e)
+    return _recorded(result, recorded, profile)
+
+def decode_job(image_path, aes_key, hmac_key, include_message=False, profile=False):
+    """Extract, verify and decrypt the payload of one image; runs inside a worker process.
+
+    AES-GCM, binary CBC+HMAC and the older base64/hex text payloads are
+    accepted. Stages are recorded as in encode_job.
+    """
+    result = {"path": image_path, "status": "ok"}
+    with Profile(memory=profile) as recorded:
+        try:
+            flags, fields = decode_payload(image_path, scatter_key=hmac_key)
+            try:
+                message = open_sealed(flags, fields, aes_key, hmac_key).decode("utf-8")
+            except UnicodeDecodeError:
+                raise ValueError("Decryption failed: Invalid key or corrupted ciphertext.")
+
+            result["message_length"] = len(message)
+            if include_message:
+                result["message"] = message
+        except Exception as e:
+            result["status"] = "error"
+            result["error"] = str(e)
+    return _recorded(result, recorded, profile)
+
+def analyze_job(pair, profile=False):
+    """Compute the quality metrics and changed pixels of one (original, stego) pair; runs inside a worker process.
+
+    The metrics run single-threaded here, since the pool already keeps every
+    core busy with one pair each. Stages are recorded as in encode_job.
+    """
+    original_path, stego_path = pair
+    result = {"original": original_path, "stego": stego_path, "status": "ok"}
+    with Profile(memory=profile) as recorded:
+        try:
+            with stage("load"):
+                original, stego = load_rgb(original_path), load_rgb(stego_path)
+            with stage("metrics"):
+                metrics = compare_arrays(original, stego, workers=1)
+            with stage("diff"):
+                changed = len(pixel_diff(original, stego).rows)
+
+            height, width = original.shape[:2]
+            result.update(width=width, height=height, original_size=os.path.getsize(original_path),
+                          stego_size=os.path.getsize(stego_path), changed_pixels=changed,
+                          changed_fraction=changed / (width * height), **metrics._asdict())
+            result.update((f"{name}_quality", quality_label(name, value))
+                          for name, value in metrics._asdict().items())
+        except Exception as e:
+            result["status"] = "error"
+            result["error"] = str(e)
+    return _recorded(result, recorded, profile)
+
+def _run_pool(worker, jobs, workers):
+    """Run jobs across a process pool sized to the CPU count.
+
+    Returns (results, summary) where summary holds the wall time, images per
+    second and the total time spent in each stage, in the order the stages
+    first ran. When the jobs were profiled, summary["profile"] is a Profile
+    holding the stage totals of every succeeded job.
+    """
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(jobs) // (workers * 4))
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(worker, jobs, chunksize=chunksize))
+    elapsed = time.perf_counter() - start
+
+    succeeded = [r for r in results if r["status"] == "ok"]
+    stages = {}
+    for r in succeeded:
+        for stage_name, wall in r["timings"].items():
+            stages[stage_name] = stages.get(stage_name, 0.0) + wall
+    summary = {
+        "images": len(results),
+        "succeeded": len(succeeded),
+        "failed": len(results) - len(succeeded),
+        "workers": workers,
+        "elapsed": elapsed,
+        "images_per_second": len(succeeded) / elapsed if elapsed else 0.0,
+        "stages": stages,
+    }
+    if any("profile" in r for r in results):
+        summary["profile"] = Profile()
+        for r in succeeded:
+            summary["profile"].merge(r["profile"])
+    return results, summary
+
+def run_encode_batch(jobs, aes_key, hmac_key, channels=None, depth=1, stream=False, scatter=False,
+                     cipher=CIPHER_GCM, compression=COMPRESSION_NONE, workers=None, kdf=KDF_SHA256, profile=False):
+    """Run encode jobs in parallel and return (results, summary).
+
+    The whole batch shares one salt, so a salted kdf derives the key once per
+    worker process instead of once per image. Jobs that share an output path
+    all fail without being run. profile=True traces memory in every job and
+    adds their combined Profile to the summary (see _run_pool).
+    """
+    worker = partial(encode_job, aes_key=aes_key, hmac_key=hmac_key, channels=channels, depth=depth,
+                     stream=stream, scatter=scatter, cipher=cipher, compression=compression, kdf=kdf,
+                     salt=new_salt(kdf), profile=profile)
+    return _run_pool(worker, _claim_outputs(jobs), workers)
+
+def run_decode_batch(image_paths, aes_key, hmac_key, include_message=False, workers=None, profile=False):
+    """Run decode/verify jobs in parallel and return (results, summary); profile is as for run_encode_batch."""
+    worker = partial(decode_job, aes_key=aes_key, hmac_key=hmac_key, include_message=include_message,
+                     profile=profile)
+    return _run_pool(worker, image_paths, workers)
+
+def run_analyze_batch(pairs, workers=None, profile=False):
+    """Compare (original, stego) pairs in parallel and return (results, summary); profile is as for run_encode_batch."""
+    return _run_pool(partial(analyze_job, profile=profile), pairs, workers)
@@ -0,0 +1,161 @@
+# benchmark.py - reproducible timings of the encode/decode pipeline on synthetic covers
+import os
+import platform
+import statistics
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+from decode_lsb import decode_payload
+from encode_lsb import encode_payload
+from envelope import CIPHER_GCM, CIPHERS, open_sealed, seal
+from instrument import Profile, stage
+
+STAGES = ("encrypt", "hmac", "embed", "save", "extract", "verify", "decrypt")
+RESOLUTIONS = (1, 12, 48)  # Megapixels
+MESSAGE_SIZES = (100, 1000, 10000, 30000)  # Characters
+PAYLOAD_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "30k characters.txt")
+SEED = 2024
+
+def cover_size(megapixels):
+    """Return the (width, height) of a 4:3 image with about the given number of megapixels."""
+    height = round((megapixels * 1e6 * 3 / 4) ** 0.5)
+    return round(height * 4 / 3), height
+
+def synthetic_cover(megapixels, seed=SEED):
+    """Return a reproducible RGB cover: smooth gradients plus a little noise, so PNG compresses it like a photo."""
+    width, height = cover_size(megapixels)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    pixels = np.empty((height, width, 3), dtype=np.uint8)
+    pixels[..., 0] = x
+    pixels[..., 1] = y
+    pixels[..., 2] = (x + y) / 2
+    noise = np.random.default_rng(seed).integers(0, 8, size=pixels.shape, dtype=np.uint8)
+    np.minimum(pixels, 255 - 8, out=pixels)
+    pixels += noise
+    return Image.fromarray(pixels)
+
+def sample_message(chars, source=PAYLOAD_FILE):
+    """Return the first chars characters of the sample text, repeated if it is shorter."""
+    try:
+        with open(source, encoding="utf-8") as f:
+            text = f.read()
+    except OSError:
+        text = "Lorem ipsum dolor sit amet, consectetur adipiscing elit. "
+    return (text * (chars // len(text) + 1))[:chars]
+
+def run_case(cover_path, message, aes_key, hmac_key, output_path, cipher=CIPHER_GCM):
+    """Runs one full round trip and returns the seconds spent in each stage.
+
+    The stages are recorded with two instrument.Profiles, one per direction,
+    so the hmac of the way back can be reported as verify. embed and extract
+    include decoding the image file. With AES-GCM the tag is made and checked
+    inside encrypt and decrypt, so the hmac and verify stages stay at zero.
+    """
+    data = message.encode("utf-8")
+    with Profile(memory=False) as sealing:
+        flags, fields = seal(data, aes_key, hmac_key, cipher)
+        encoded_img = encode_payload(cover_path, fields, flags=flags)
+        with stage("save"):
+            encoded_img.save(output_path, format="PNG")
+    with Profile(memory=False) as opening:
+        flags, fields = decode_payload(output_path)
+        if open_sealed(flags, fields, aes_key, hmac_key) != data:
+            raise ValueError("The benchmark message did not survive the round trip.")
+
+    sealed, opened = sealing.walls(), opening.walls()
+    return {
+        "encrypt": sealed.get("encrypt", 0.0),
+        "hmac": sealed.get("hmac", 0.0),
+        "embed": sealed.get("image decode", 0.0) + sealed.get("embed", 0.0),
+        "save": sealed.get("save", 0.0),
+        "extract": opened.get("image decode", 0.0) + opened.get("extract", 0.0),
+        "verify": opened.get("hmac", 0.0),
+        "decrypt": opened.get("decrypt", 0.0),
+    }
+
+def environment():
+    """Return the facts about this machine and its libraries that a timing depends on."""
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "pillow": Image.__version__,
+    }
+
+def run_benchmark(resolutions=RESOLUTIONS, message_sizes=MESSAGE_SIZES, repeat=3, ciphers=CIPHERS,
+                  aes_key="Sixteen byte key", hmac_key="DemoHMACKey-1-ForTestingPurposes", report=None):
+    """Times every stage for each cover resolution, message size and cipher; returns a JSON-ready dict.
+
+    Both ciphers run by default: AES-GCM authenticates inside encrypt and
+    decrypt, so only AES-CBC + HMAC measures the hmac and verify stages.
+
+    Each case runs repeat times and keeps the minimum and median of every
+    stage; the minimum is the steadiest figure to compare between runs.
+    Covers are written once as PNG to a temporary directory, so embed
+    includes decoding the cover file, as it does in the GUI and CLI.
+    report, if given, is called with each finished case.
+    """
+    cases = []
+    with tempfile.TemporaryDirectory() as directory:
+        output_path = os.path.join(directory, "stego.png")
+        for megapixels in resolutions:
+            cover = synthetic_cover(megapixels)
+            cover_path = os.path.join(directory, f"cover_{megapixels}mp.png")
+            cover.save(cover_path)
+            width, height = cover.size
+            del cover
+
+            for chars in message_sizes:
+                message = sample_message(chars)
+                for cipher in ciphers:
+                    runs = [run_case(cover_path, message, aes_key, hmac_key, output_path, cipher)
+                            for _ in range(repeat)]
+                    case = {
+                        "megapixels": megapixels,
+                        "width": width,
+                        "height": height,
+                        "message_chars": chars,
+                        "cipher": cipher,
+                        "stages": {stage: {"min": min(r[stage] for r in runs),
+                                           "median": statistics.median(r[stage] for r in runs)}
+                                   for stage in STAGES},
+                    }
+                    case["total"] = sum(times["min"] for times in case["stages"].values())
+                    cases.append(case)
+                    if report is not None:
+                        report(case)
+
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": environment(),
+        "repeat": repeat,
+        "seed": SEED,
+        "cases": cases,
+    }
+
+def _case_key(case):
+    return case["megapixels"], case["message_chars"], case["cipher"]
+
+def compare_runs(baseline, current, threshold=0.1, floor=0.001):
+    """Return (case, stage, before, after) for every stage at least threshold slower than in baseline.
+
+    Minimum times are compared; stages under floor seconds in both runs are
+    too short to judge and are skipped.
+    """
+    before = {_case_key(case): case for case in baseline["cases"]}
+    slower = []
+    for case in current["cases"]:
+        old = before.get(_case_key(case))
+        if old is None:
+            continue
+        for stage in STAGES:
+            was, now = old["stages"][stage]["min"], case["stages"][stage]["min"]
+            if max(was, now) >= floor and now > was * (1 + threshold):
+                slower.append((case, stage, was, now))
+    return slower
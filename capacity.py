@@ -0,0 +1,80 @@
+from collections import namedtuple
+
+from aes import BLOCK_SIZE, KDF_SHA256, NONCE_SIZE, TAG_SIZE, _salt_size, cbc_length, gcm_length
+from envelope import CIPHER_CBC, CIPHER_GCM, MAC_SIZE
+from lsb_engine import channel_indices
+from payload import FIELD, HEADER_SIZE
+
+# Result of planning one message for one image
+CapacityPlan = namedtuple("CapacityPlan", ["payload_bytes", "capacity_bytes", "pixels_used", "max_message_bytes", "fits"])
+
+def _bits_per_pixel(channels, depth, channel_count):
+    indices = channel_indices(channels) if channels else range(channel_count)
+    return len(indices) * depth
+
+def body_capacity(width, height, channels=None, depth=1, channel_count=3):
+    """Return how many container body bytes an image holds with the given layout.
+
+    The header takes the blue LSB of the first HEADER_SIZE * 8 pixels and the
+    body the rest, whether or not it is scattered.
+    """
+    body_pixels = max(width * height - HEADER_SIZE * 8, 0)
+    return body_pixels * _bits_per_pixel(channels, depth, channel_count) // 8
+
+def ciphertext_size(message_bytes, cipher=CIPHER_GCM, kdf=KDF_SHA256):
+    """Return the size of the ciphertext field value for a plaintext length."""
+    if cipher == CIPHER_GCM:
+        return gcm_length(message_bytes, kdf)
+    if cipher == CIPHER_CBC:
+        return cbc_length(message_bytes, kdf)
+    raise ValueError(f"Unknown cipher mode: {cipher}")
+
+def _overhead(cipher, key_length, extra_fields, kdf=KDF_SHA256):
+    """Body bytes around the ciphertext: the field headers, stored key, KDF name, MAC and extra fields."""
+    overhead = FIELD.size + key_length + FIELD.size + sum(FIELD.size + length for length in extra_fields)
+    if kdf != KDF_SHA256:
+        overhead += FIELD.size + len(kdf)
+    if cipher == CIPHER_CBC:
+        overhead += FIELD.size + MAC_SIZE
+    return overhead
+
+def payload_size(message_bytes, cipher=CIPHER_GCM, key_length=16, extra_fields=(), kdf=KDF_SHA256):
+    """Return the exact container body size that envelope.seal produces for a message length.
+
+    extra_fields lists the value lengths of any further fields, such as a
+    file name. With compression this is an upper bound, since seal only keeps
+    the compressed form when it is smaller.
+    """
+    return _overhead(cipher, key_length, extra_fields, kdf) + ciphertext_size(message_bytes, cipher, kdf)
+
+def max_message_bytes(capacity_bytes, cipher=CIPHER_GCM, key_length=16, extra_fields=(), kdf=KDF_SHA256):
+    """Return the longest plaintext (in bytes) whose sealed payload fits in capacity_bytes."""
+    available = capacity_bytes - _overhead(cipher, key_length, extra_fields, kdf) - _salt_size(kdf)
+    if cipher == CIPHER_GCM:
+        available -= NONCE_SIZE + TAG_SIZE
+    elif cipher == CIPHER_CBC:
+        # The IV takes a block and padding always adds 1-16 bytes
+        available = (available - BLOCK_SIZE) // BLOCK_SIZE * BLOCK_SIZE - 1
+    else:
+        raise ValueError(f"Unknown cipher mode: {cipher}")
+    return max(available, 0)
+
+def plan(width, height, message_bytes, channels=None, depth=1, cipher=CIPHER_GCM, channel_count=3,
+         key_length=16, extra_fields=(), kdf=KDF_SHA256):
+    """Plans a message of message_bytes plaintext bytes for an image of the given size.
+
+    Pure arithmetic on the dimensions and mode, so it is O(1) and needs no
+    pixel data. Returns a CapacityPlan with the exact body size, the image's
+    body capacity, the pixels written (header included), the longest message
+    that would fit and whether this one does.
+    """
+    payload_bytes = payload_size(message_bytes, cipher, key_length, extra_fields, kdf)
+    capacity_bytes = body_capacity(width, height, channels, depth, channel_count)
+    bits_per_pixel = _bits_per_pixel(channels, depth, channel_count)
+    return CapacityPlan(
+        payload_bytes=payload_bytes,
+        capacity_bytes=capacity_bytes,
+        pixels_used=HEADER_SIZE * 8 + -(-payload_bytes * 8 // bits_per_pixel),
+        max_message_bytes=max_message_bytes(capacity_bytes, cipher, key_length, extra_fields, kdf),
+        fits=payload_bytes <= capacity_bytes,
+    )
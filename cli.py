@@ -0,0 +1,266 @@
+# cli.py - headless entry point for batch jobs (no Tkinter)
+import argparse
+import json
+import os
+import sys
+
+from batch import (find_images, output_path_for, read_manifest, read_pairs, run_analyze_batch, run_decode_batch,
+                   run_encode_batch)
+from aes import KDF_SHA256, KDFS
+from benchmark import MESSAGE_SIZES, RESOLUTIONS, STAGES, compare_runs, run_benchmark
+from compression import COMPRESSION_NONE, COMPRESSIONS
+from envelope import CIPHER_GCM, CIPHERS
+from file_stego import extract_file, hide_file
+from instrument import Profile
+from progress import ProgressTracker
+from quality_report import REPORT_FORMATS, can_plot, plot_report, write_report
+
+# These run their jobs in worker processes, which record their own profiles
+POOLED_COMMANDS = ("encode", "decode", "analyze")
+
+def _keys(args):
+    """Return the AES and HMAC keys from the arguments or environment."""
+    aes_key = args.aes_key or os.environ.get("STEGO_AES_KEY", "")
+    hmac_key = args.hmac_key or os.environ.get("STEGO_HMAC_KEY", "")
+    if len(aes_key) not in [16, 24, 32]:
+        sys.exit("Error: AES Key must be 16, 24, or 32 characters long.")
+    if not hmac_key:
+        sys.exit("Error: Please provide an HMAC key.")
+    return aes_key, hmac_key
+
+def _progress(args):
+    """Return a progress hook that draws a one-line status on stderr, or None without --progress."""
+    if not args.progress:
+        return None
+
+    def show(done, total, eta):
+        eta_text = f", about {eta:.0f} s left" if eta is not None and done < total else ""
+        print(f"\r{100 * done // max(total, 1):3d}% of {total} pixels{eta_text}   ", end="", file=sys.stderr,
+              flush=True)
+        if done >= total:
+            print(file=sys.stderr)
+    return ProgressTracker(show)
+
+def _print_summary(summary):
+    print(f"Processed {summary['images']} images with {summary['workers']} workers "
+          f"in {summary['elapsed']:.2f} s ({summary['images_per_second']:.2f} images/s)")
+    print(f"Succeeded: {summary['succeeded']}  Failed: {summary['failed']}")
+    count = max(summary["succeeded"], 1)
+    for stage, total in summary["stages"].items():
+        print(f"  {stage:<16} total {total:8.3f} s   mean {total / count * 1000:8.2f} ms")
+    if "profile" in summary:
+        print(summary["profile"].summary(), file=sys.stderr)
+
+def encode_command(args):
+    aes_key, hmac_key = _keys(args)
+
+    if args.manifest:
+        jobs = read_manifest(args.manifest)
+        for job in jobs:
+            job["output"] = job["output"] or output_path_for(job["image"], args.output_dir,
+                                                             os.path.dirname(os.path.abspath(args.manifest)))
+    else:
+        if args.message is None and not args.message_file:
+            sys.exit("Error: Please provide --message or --message-file when encoding a directory.")
+        jobs = [{
+            "image": image_path,
+            "payload": args.message_file,
+            "message": args.message,
+            "output": output_path_for(image_path, args.output_dir, args.input),
+        } for image_path in find_images(args.input)]
+
+    if not jobs:
+        sys.exit("Error: No images to encode.")
+
+    results, summary = run_encode_batch(jobs, aes_key, hmac_key, channels=args.channels,
+                                        depth=args.depth, stream=args.stream, scatter=args.scatter,
+                                        cipher=args.cipher, compression=args.compression, workers=args.workers,
+                                        kdf=args.kdf, profile=args.profile)
+    for result in results:
+        if result["status"] != "ok":
+            print(f"FAILED {result['image']}: {result['error']}", file=sys.stderr)
+    _print_summary(summary)
+    return 1 if summary["failed"] else 0
+
+def decode_command(args):
+    aes_key, hmac_key = _keys(args)
+
+    image_paths = find_images(args.input)
+    if not image_paths:
+        sys.exit("Error: No images to decode.")
+
+    results, summary = run_decode_batch(image_paths, aes_key, hmac_key,
+                                        include_message=args.include_message, workers=args.workers,
+                                        profile=args.profile)
+    with open(args.report, "w", encoding="utf-8") as f:
+        for result in results:
+            f.write(json.dumps(result) + "\n")
+    print(f"Report written to {args.report}")
+    _print_summary(summary)
+    return 1 if summary["failed"] else 0
+
+def analyze_command(args):
+    if not args.report.lower().endswith(REPORT_FORMATS):
+        sys.exit(f"Error: The report must be a {' or '.join(REPORT_FORMATS)} file.")
+    if args.plots and not can_plot():
+        sys.exit("Error: --plots needs matplotlib (pip install matplotlib).")
+    pairs = read_pairs(args.manifest)
+    if not pairs:
+        sys.exit("Error: No image pairs to analyze.")
+
+    results, summary = run_analyze_batch(pairs, workers=args.workers, profile=args.profile)
+    for result in results:
+        if result["status"] != "ok":
+            print(f"FAILED {result['stego']}: {result['error']}", file=sys.stderr)
+    write_report(results, args.report)
+    print(f"Report written to {args.report}")
+    if args.plots and summary["succeeded"]:
+        for path in plot_report(results, args.plots):
+            print(f"Plot written to {path}")
+    elif args.plots:
+        print("No pairs were analyzed successfully, so no plots were written.", file=sys.stderr)
+    _print_summary(summary)
+    return 1 if summary["failed"] else 0
+
+def benchmark_command(args):
+    def show(case):
+        times = "  ".join(f"{stage} {case['stages'][stage]['min'] * 1000:.2f}" for stage in STAGES)
+        print(f"{case['megapixels']:>5} MP  {case['message_chars']:>6} chars  {case['cipher']}  {times}  (ms)",
+              flush=True)
+
+    results = run_benchmark(args.resolutions, args.sizes, args.repeat, args.ciphers, report=show)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=1)
+    print(f"Results written to {args.output}")
+
+    if not args.baseline:
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        slower = compare_runs(json.load(f), results, args.threshold)
+    for case, stage, before, after in slower:
+        print(f"SLOWER {case['megapixels']} MP {case['message_chars']} chars {case['cipher']} {stage}: "
+              f"{before * 1000:.1f} ms -> {after * 1000:.1f} ms", file=sys.stderr)
+    print(f"{len(slower)} stages slower than {args.baseline} by more than {args.threshold:.0%}")
+    return 1 if slower else 0
+
+def hide_command(args):
+    aes_key, hmac_key = _keys(args)
+    size = hide_file(args.image, args.file, args.output, aes_key, hmac_key, cipher=args.cipher,
+                     channels=args.channels, depth=args.depth, scatter=args.scatter,
+                     compression=args.compression, progress=_progress(args), kdf=args.kdf)
+    print(f"Hid {args.file} ({size} bytes) in {args.output}")
+    return 0
+
+def extract_command(args):
+    aes_key, hmac_key = _keys(args)
+    output_path = extract_file(args.image, args.output_dir, aes_key, hmac_key, output_name=args.name,
+                               progress=_progress(args))
+    print(f"Extracted {output_path} ({os.path.getsize(output_path)} bytes)")
+    return 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Headless LSB steganography tools.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    encode = subparsers.add_parser("encode", help="Encrypt and embed payloads into many images.")
+    source = encode.add_mutually_exclusive_group(required=True)
+    source.add_argument("--input", help="Directory of cover images.")
+    source.add_argument("--manifest", help="CSV file with image, payload and optional output and compression columns.")
+    encode.add_argument("--message", help="Message to hide in every image of --input.")
+    encode.add_argument("--message-file", help="Text file to hide in every image of --input.")
+    encode.add_argument("--output-dir", default="encoded", help="Where stego images are written.")
+    encode.add_argument("--aes-key", help="AES key (or set STEGO_AES_KEY).")
+    encode.add_argument("--hmac-key", help="HMAC key (or set STEGO_HMAC_KEY).")
+    encode.add_argument("--channels", help="Channels to embed into, e.g. RGB (default: all).")
+    encode.add_argument("--depth", type=int, default=1, choices=range(1, 5), help="Bits per channel.")
+    encode.add_argument("--stream", action="store_true",
+                        help="Write each PNG strip by strip to bound memory on very large images.")
+    encode.add_argument("--scatter", action="store_true",
+                        help="Scatter payload pixels in an order keyed by the HMAC key.")
+    encode.add_argument("--cipher", choices=CIPHERS, default=CIPHER_GCM,
+                        help="AES-GCM (single pass, default) or AES-CBC followed by HMAC-SHA256.")
+    encode.add_argument("--compression", choices=COMPRESSIONS, default=COMPRESSION_NONE,
+                        help="Compress payloads before encryption (kept only when smaller).")
+    encode.add_argument("--kdf", choices=KDFS, default=KDF_SHA256,
+                        help="How the AES key is derived from the password; salted KDFs share one salt per run.")
+    encode.add_argument("--workers", type=int, help="Worker processes (default: CPU count).")
+    encode.add_argument("--profile", action="store_true",
+                        help="Print wall time, CPU time and peak memory per stage, over all images, on stderr.")
+    encode.set_defaults(func=encode_command)
+
+    decode = subparsers.add_parser("decode", help="Extract, verify and decrypt payloads from many images.")
+    decode.add_argument("--input", required=True, help="Directory tree of stego images.")
+    decode.add_argument("--report", default="decode_report.jsonl", help="JSON-lines report to write.")
+    decode.add_argument("--include-message", action="store_true", help="Store decrypted messages in the report.")
+    decode.add_argument("--aes-key", help="AES key (or set STEGO_AES_KEY).")
+    decode.add_argument("--hmac-key", help="HMAC key (or set STEGO_HMAC_KEY).")
+    decode.add_argument("--workers", type=int, help="Worker processes (default: CPU count).")
+    decode.add_argument("--profile", action="store_true",
+                        help="Print wall time, CPU time and peak memory per stage, over all images, on stderr.")
+    decode.set_defaults(func=decode_command)
+
+    analyze = subparsers.add_parser("analyze", help="Compare many original/stego pairs and write a quality report.")
+    analyze.add_argument("--manifest", required=True, help="CSV file with original and stego columns.")
+    analyze.add_argument("--report", default="quality_report.csv", help="Table to write (.csv or .json).")
+    analyze.add_argument("--plots", help="Directory for PNG plots of the metric distributions.")
+    analyze.add_argument("--workers", type=int, help="Worker processes (default: CPU count).")
+    analyze.add_argument("--profile", action="store_true",
+                         help="Print wall time, CPU time and peak memory per stage, over all pairs, on stderr.")
+    analyze.set_defaults(func=analyze_command)
+
+    benchmark = subparsers.add_parser("benchmark", help="Time each pipeline stage on synthetic covers.")
+    benchmark.add_argument("--resolutions", type=float, nargs="+", default=RESOLUTIONS,
+                           help="Cover sizes in megapixels.")
+    benchmark.add_argument("--sizes", type=int, nargs="+", default=MESSAGE_SIZES, help="Message sizes in characters.")
+    benchmark.add_argument("--repeat", type=int, default=3, help="Runs per case; the minimum is kept.")
+    benchmark.add_argument("--ciphers", choices=CIPHERS, nargs="+", default=CIPHERS,
+                           help="Ciphers to time (default: both; only cbc has separate hmac and verify stages).")
+    benchmark.add_argument("--output", default="benchmark.json", help="JSON file to write the results to.")
+    benchmark.add_argument("--baseline", help="Earlier results to compare against; exits 1 on a regression.")
+    benchmark.add_argument("--threshold", type=float, default=0.1, help="Slowdown that counts as a regression.")
+    benchmark.set_defaults(func=benchmark_command)
+
+    hide = subparsers.add_parser("hide", help="Encrypt any file and hide it, with its name, in an image.")
+    hide.add_argument("--image", required=True, help="Cover image.")
+    hide.add_argument("--file", required=True, help="File to hide.")
+    hide.add_argument("--output", required=True, help="Stego image to write (PNG).")
+    hide.add_argument("--aes-key", help="AES key (or set STEGO_AES_KEY).")
+    hide.add_argument("--hmac-key", help="HMAC key (or set STEGO_HMAC_KEY).")
+    hide.add_argument("--channels", help="Channels to embed into, e.g. RGB (default: all).")
+    hide.add_argument("--depth", type=int, default=1, choices=range(1, 5), help="Bits per channel.")
+    hide.add_argument("--scatter", action="store_true",
+                      help="Scatter payload pixels in an order keyed by the HMAC key.")
+    hide.add_argument("--cipher", choices=CIPHERS, default=CIPHER_GCM,
+                      help="AES-GCM (single pass, default) or AES-CBC followed by HMAC-SHA256.")
+    hide.add_argument("--compression", choices=COMPRESSIONS, default=COMPRESSION_NONE,
+                      help="Compress the file before encryption.")
+    hide.add_argument("--kdf", choices=KDFS, default=KDF_SHA256,
+                      help="How the AES key is derived from the password.")
+    hide.add_argument("--progress", action="store_true", help="Show embedding progress on stderr.")
+    hide.add_argument("--profile", action="store_true",
+                      help="Print wall time, CPU time and peak memory per stage on stderr.")
+    hide.set_defaults(func=hide_command)
+
+    extract = subparsers.add_parser("extract", help="Extract, verify and decrypt a hidden file to disk.")
+    extract.add_argument("--image", required=True, help="Stego image holding a file.")
+    extract.add_argument("--output-dir", default=".", help="Directory to write the file to.")
+    extract.add_argument("--name", help="File name to use instead of the stored one.")
+    extract.add_argument("--aes-key", help="AES key (or set STEGO_AES_KEY).")
+    extract.add_argument("--hmac-key", help="HMAC key (or set STEGO_HMAC_KEY).")
+    extract.add_argument("--progress", action="store_true", help="Show extraction progress on stderr.")
+    extract.add_argument("--profile", action="store_true",
+                         help="Print wall time, CPU time and peak memory per stage on stderr.")
+    extract.set_defaults(func=extract_command)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if not getattr(args, "profile", False) or args.command in POOLED_COMMANDS:
+        return args.func(args)
+    with Profile() as profile:
+        status = args.func(args)
+    print(profile.summary(), file=sys.stderr)
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
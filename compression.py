@@ -0,0 +1,65 @@
+import bz2
+import lzma
+import zlib
+
+# Compression applied before encryption; the codec name is stored in the payload
+COMPRESSION_NONE = "none"
+COMPRESSION_ZLIB = "zlib"
+COMPRESSION_LZMA = "lzma"
+COMPRESSION_BZ2 = "bz2"
+COMPRESSIONS = (COMPRESSION_NONE, COMPRESSION_ZLIB, COMPRESSION_LZMA, COMPRESSION_BZ2)
+
+ZLIB_LEVEL = 9
+LZMA_PRESET = 6
+BZ2_LEVEL = 9
+
+def _compressor(method):
+    if method == COMPRESSION_ZLIB:
+        return zlib.compressobj(ZLIB_LEVEL)
+    if method == COMPRESSION_LZMA:
+        return lzma.LZMACompressor(preset=LZMA_PRESET)
+    if method == COMPRESSION_BZ2:
+        return bz2.BZ2Compressor(BZ2_LEVEL)
+    raise ValueError(f"Unknown compression method: {method}")
+
+def _decompressor(method):
+    if method == COMPRESSION_ZLIB:
+        return zlib.decompressobj()
+    if method == COMPRESSION_LZMA:
+        return lzma.LZMADecompressor()
+    if method == COMPRESSION_BZ2:
+        return bz2.BZ2Decompressor()
+    raise ValueError(f"Unknown compression method: {method}")
+
+def compress(data, method):
+    """Compresses bytes with the given method."""
+    compressor = _compressor(method)
+    return compressor.compress(data) + compressor.flush()
+
+def decompress(data, method):
+    """Decompresses bytes written by compress."""
+    return b"".join(decompress_stream([data], method))
+
+def compress_stream(chunks, method):
+    """Compresses an iterable of byte chunks, yielding compressed chunks."""
+    compressor = _compressor(method)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+def decompress_stream(chunks, method):
+    """Decompresses an iterable of byte chunks, yielding the original data."""
+    decompressor = _decompressor(method)
+    try:
+        for chunk in chunks:
+            data = decompressor.decompress(chunk)
+            if data:
+                yield data
+        if method == COMPRESSION_ZLIB:
+            yield decompressor.flush()
+    except (zlib.error, lzma.LZMAError, OSError, EOFError):
+        raise ValueError("Decompression failed: The payload is corrupted.")
+    if not decompressor.eof:
+        raise ValueError("Decompression failed: The payload is truncated.")
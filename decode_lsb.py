@@ -1,30 +1,189 @@
+import base64
+from functools import partial
+
+import numpy as np
 from PIL import Image
 
-def decode_lsb(encoded_image_path):
-    """Decodes a message hidden using LSB encoding from an image."""
-    img = Image.open(encoded_image_path)
-    binary_message = ""
+from instrument import stage, timed_chunks
+from lsb_engine import BLUE, iter_read, mask_to_indices, read_array_bytes, read_bytes, scatter_order
+from payload import (FIELD_CIPHERTEXT, FIELD_KEY, FIELD_MAC, FLAG_AEAD, FLAG_BINARY, FLAG_BOUND, FLAG_SCATTER,
+                     HEADER_SIZE, is_payload, pack_payload, unpack_fields, unpack_header)
+
+# Pixels read in the first chunk; each further chunk doubles in size
+CHUNK_PIXELS = 4096
+
+def _read_until_null(img):
+    """Reads blue-channel LSBs in chunks and returns the bytes before the null character."""
     width, height = img.size
+    data = bytearray()
+    leftover = np.empty(0, dtype=np.uint8)
+    chunk_pixels = CHUNK_PIXELS
+    row = 0
+
+    while row < height:
+        rows = max(1, chunk_pixels // width)
+        # Only the rows of this chunk are copied out of the image
+        band = np.asarray(img.crop((0, row, width, min(row + rows, height))))
+        bits = np.concatenate((leftover, band[:, :, 2].reshape(-1) & 1))
+        row += rows
+        chunk_pixels *= 2
+
+        # Keep the bits of an incomplete byte for the next chunk
+        usable = len(bits) - len(bits) % 8
+        leftover = bits[usable:]
+        chunk = np.packbits(bits[:usable])
+
+        nulls = np.flatnonzero(chunk == 0)
+        if len(nulls):
+            data += chunk[:nulls[0]].tobytes()
+            return bytes(data)
+        data += chunk.tobytes()
 
-    for y in range(height):
-        for x in range(width):
-            pixel = list(img.getpixel((x, y)))
-            # Extract the least significant bit of the blue channel
-            binary_message += str(pixel[2] & 1)
-
-    # Split binary message into bytes and convert to characters
-    message = ""
-    for i in range(0, len(binary_message), 8):
-        byte = binary_message[i:i + 8]
-        if byte == "00000000":  # Stop at null character
-            break
-        message += chr(int(byte, 2))
-
-    # Extract original message and AES key from decoded_message
-    parts = message.rsplit("\n", 2)  
+    # No terminator: a trailing partial byte is read as-is
+    if len(leftover):
+        data.append(int(''.join(map(str, leftover)), 2))
+    return bytes(data)
+
+def _open_rgb(encoded_image_path):
+    """Opens an image and converts it to RGB unless it already has RGB channels."""
+    img = Image.open(encoded_image_path)
+    if img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGB')
+    return img
+
+def _split_legacy(message):
+    """Splits a legacy null-terminated text stream into its three fields."""
+    parts = message.rsplit("\n", 2)
     if len(parts) < 3:
         raise ValueError("Decoded message does not contain a valid ciphertext or key.")
+    return parts
+
+def _read_header(read, pixel_count, header_channels, scatter_key):
+    """Reads the container header; returns (header, scatter order or None), or None without a header."""
+    header = read(0, HEADER_SIZE, header_channels, 1, None)
+    if not is_payload(header):
+        return None
+    header = unpack_header(header)
+
+    order = None
+    if header.flags & FLAG_SCATTER:
+        if not scatter_key:
+            raise ValueError("The payload is scattered with a key; provide the key to decode it.")
+        order = scatter_order(scatter_key, max(pixel_count - header.size * 8, 0))
+    return header, order
+
+def read_payload(read, pixel_count, header_channels=BLUE, scatter_key=None, progress=None):
+    """Reads a payload container through read(start, count, channels, depth, order).
 
-    original_message, ciphertext, stored_key = parts
+    The header is read first, then exactly as many body bytes as it announces.
+    Returns (flags, fields), or None when there is no container header. With
+    a progress hook the body is read in pieces, reporting (pixels done,
+    pixels total) after each.
+    """
+    found = _read_header(read, pixel_count, header_channels, scatter_key)
+    if found is None:
+        return None
+    header, order = found
+    args = (header.size * 8, header.body_length, mask_to_indices(header.channel_mask), header.depth, order)
+    if progress is None:
+        body = read(*args)
+    else:
+        body = b"".join(iter_read(read, *args, progress=progress))
+    return header.flags, unpack_fields(body)
+
+def read_payload_stream(read, pixel_count, header_channels=BLUE, scatter_key=None, progress=None):
+    """Like read_payload, but returns (flags, body chunks) with the body read lazily in chunks.
+
+    Parse the chunks with payload.iter_fields or envelope.open_sealed_stream.
+    progress(pixels done, pixels total) is called as the chunks are read.
+    """
+    found = _read_header(read, pixel_count, header_channels, scatter_key)
+    if found is None:
+        return None
+    header, order = found
+    body = iter_read(read, header.size * 8, header.body_length, mask_to_indices(header.channel_mask), header.depth,
+                     order, progress)
+    # The body is read as the caller consumes it, so time it apart from the decryption it feeds
+    return header.flags, timed_chunks("read pixels", body)
+
+def decode_payload(encoded_image_path, scatter_key=None, progress=None):
+    """Decodes the payload hidden in an image and returns (flags, fields).
+
+    Images written in the legacy text format are detected and returned with
+    their ciphertext, HMAC and key as fields and no flags set. scatter_key is
+    only needed for payloads written in keyed scatter order. progress is an
+    optional hook called with (pixels done, pixels total) while the body is
+    read; see progress.ProgressTracker.
+    """
+    with stage("image decode"):
+        img = _open_rgb(encoded_image_path)
+        img.load()
+
+    # Reading in pieces goes through one pixel array so scattered pieces do not each rescan the image
+    with stage("extract"):
+        read = partial(read_bytes, img) if progress is None else partial(read_array_bytes, np.asarray(img))
+        decoded = read_payload(read, img.size[0] * img.size[1], scatter_key=scatter_key, progress=progress)
+        if decoded is not None:
+            return decoded
+        return _legacy_payload(img)
+
+def _legacy_payload(img):
+    """Reads a legacy text payload from an image already known to have no container header."""
+    # Each byte maps to one character, exactly as chr(int(byte, 2)) did
+    ciphertext, hmac_value, key = _split_legacy(_read_until_null(img).decode('latin-1'))
+    return 0, {
+        FIELD_CIPHERTEXT: ciphertext.encode('utf-8'),
+        FIELD_MAC: hmac_value.encode('utf-8'),
+        FIELD_KEY: key.encode('utf-8'),
+    }
+
+def decode_payload_stream(encoded_image_path, scatter_key=None, progress=None):
+    """Decodes the payload of an image lazily and returns (flags, body chunks).
+
+    For payloads too large to hold in memory: the body is read a chunk at a
+    time as it is iterated, reporting to progress if given. Legacy images are
+    small and are returned as a single chunk.
+    """
+    with stage("image decode"):
+        img = _open_rgb(encoded_image_path)
+        pixels = np.asarray(img)
+    decoded = read_payload_stream(partial(read_array_bytes, pixels), img.size[0] * img.size[1],
+                                  scatter_key=scatter_key, progress=progress)
+    if decoded is not None:
+        return decoded
+
+    # Reuse the decoded image rather than opening the file a second time
+    flags, fields = _legacy_payload(img)
+    return flags, [pack_payload(fields)[HEADER_SIZE:]]
+
+def decode_lsb(encoded_image_path, scatter_key=None):
+    """Decodes a message hidden using LSB encoding from an image.
+
+    Binary payloads are returned in text form (base64 ciphertext, hex MAC);
+    their MAC covers the raw ciphertext, so verify it with verify_hmac_bytes
+    on the fields from decode_payload instead. AES-GCM payloads have no
+    separate MAC to return, and the MAC of a FLAG_BOUND payload also covers
+    other fields, so both are rejected.
+    """
+    flags, fields = decode_payload(encoded_image_path, scatter_key)
+    if flags & FLAG_AEAD:
+        raise ValueError("The payload is sealed with AES-GCM, which has no separate HMAC; "
+                         "open it with decode_payload and envelope.open_sealed instead.")
+    if flags & FLAG_BOUND:
+        raise ValueError("The payload's HMAC also covers its codec, KDF or file fields; "
+                         "open it with decode_payload and envelope.open_sealed instead.")
+
+    # Extract original message and AES key from the decoded payload
+    try:
+        if flags & FLAG_BINARY:
+            original_message = base64.b64encode(fields[FIELD_CIPHERTEXT]).decode('ascii')
+            ciphertext = fields[FIELD_MAC].hex()
+            stored_key = fields[FIELD_KEY].decode('utf-8')
+        else:
+            original_message, ciphertext, stored_key = (
+                fields[field].decode('utf-8') for field in (FIELD_CIPHERTEXT, FIELD_MAC, FIELD_KEY)
+            )
+    except (KeyError, UnicodeDecodeError):
+        raise ValueError("Decoded message does not contain a valid ciphertext or key.")
 
-    return original_message, ciphertext, stored_key
\ No newline at end of file
+    return original_message, ciphertext, stored_key
@@ -1,29 +1,271 @@
+import os
+import tempfile
+from functools import partial
+
+import numpy as np
 from PIL import Image
 
-def encode_lsb(image_path, message):
+from image_probe import color_mode
+from instrument import stage
+from lsb_engine import (BLUE, ScatteredBits, bytes_to_bits, channel_indices, header_channels, indices_to_mask,
+                        pixels_needed, scatter_order, write_bits, write_bits_window, write_stream)
+from payload import FLAG_SCATTER, HEADER_SIZE, iter_body, pack_header, pack_payload, stream_body_length
+from png_writer import PNGStreamWriter
+
+# Rows converted and written at a time by the streaming encoder
+STRIP_ROWS = 256
+
+def _message_to_bits(message):
+    """Converts a message into an array of bits, 8 per character (MSB first)."""
+    try:
+        data = message.encode('latin-1')
+    except UnicodeEncodeError:
+        # Characters above 0xFF produce more than 8 bits with format(..., '08b');
+        # keep that stream so the output matches the original encoder exactly
+        stream = ''.join(format(ord(i), '08b') for i in message)
+        return np.frombuffer(stream.encode('ascii'), dtype=np.uint8) - ord('0')
+    return bytes_to_bits(data)
+
+def _writable_image(img, mode, in_place=False):
+    """Return the image in the given mode, ready to modify, copying only when needed.
+
+    Converting already makes a new image; a matching image is copied unless
+    the caller owns it and asked for in_place.
+    """
+    if img.mode != mode:
+        return img.convert(mode)
+    return img if in_place else img.copy()
+
+def _window_writers(layers):
+    """Return a write(rows, window_start=...) function per bit stream, for writing them strip by strip.
+
+    Scattered streams are packed and sorted by pixel once here, so each strip
+    only writes its own slice of them.
+    """
+    writers = []
+    for bits, start, indices, bit_depth, order in layers:
+        if order is not None:
+            writers.append(ScatteredBits(bits, start, indices, bit_depth, order).write_window)
+        else:
+            writers.append(partial(write_bits_window, bits=bits, start=start, channels=indices, depth=bit_depth))
+    return writers
+
+def _embed_layers(img, layers, strip_rows=STRIP_ROWS, progress=None):
+    """Writes bit streams into an image in place, one strip of rows at a time.
+
+    Only the rows that carry bits are copied out and pasted back, so the
+    extra memory is bounded by one strip. progress(pixels done, pixels
+    total) is called after each strip if given.
+    """
+    width = img.size[0]
+    end_row = min(-(-layers_end(layers) // width), img.size[1])
+    writers = _window_writers(layers)
+    for top in range(0, end_row, strip_rows):
+        box = (0, top, width, min(top + strip_rows, end_row))
+        rows = np.array(img.crop(box))
+        for write in writers:
+            write(rows, window_start=top * width)
+        img.paste(Image.fromarray(rows), box[:2])
+        if progress is not None:
+            progress(box[3] * width, end_row * width)
+    return img
+
+def encode_lsb(image_path, message, progress=None):
     """Encodes a message into the least significant bits of an image."""
-    # Open the image
-    img = Image.open(image_path)
+    with stage("image decode"):
+        img = _writable_image(Image.open(image_path), 'RGB', in_place=True)
+        img.load()
+
+    message += chr(0)  # Add a null character to indicate the end of the message
+    bits = _message_to_bits(message)
+
+    # Bits that do not fit in the image are dropped, as before
+    with stage("embed"):
+        return _embed_layers(img, [(bits[:img.size[0] * img.size[1]], 0, BLUE, 1, None)], progress=progress)
+
+def _body_layout(flags, channels, depth, channel_count, pixel_count, scatter_key):
+    """Validates the body layout and returns (flags, channel indices, scatter order or None)."""
+    if not 1 <= depth <= 4:
+        raise ValueError("Bits per channel must be between 1 and 4.")
+    indices = channel_indices(channels) if channels else tuple(range(channel_count))
+    if max(indices) >= channel_count:
+        raise ValueError(f"Image has no {channels} channels to write to.")
+
+    order = None
+    if scatter_key:
+        flags |= FLAG_SCATTER
+        order = scatter_order(scatter_key, max(pixel_count - HEADER_SIZE * 8, 0))
+    return flags, indices, order
+
+def payload_layers(fields, flags=0, channels=None, depth=1, channel_count=3, pixel_count=None,
+                   scatter_key=None):
+    """Packs a container and returns its bit streams as (bits, start pixel, channels, depth, order).
+
+    The header always sits in the blue LSBs of the first pixels (the only
+    channel of a gray image); the body follows it with the requested layout.
+    channels is a string such as "RGB" or None for every channel. With a
+    scatter_key the body pixels are visited in a keyed pseudo-random order
+    over the rest of the image (pixel_count pixels in total).
+    """
+    flags, indices, order = _body_layout(flags, channels, depth, channel_count, pixel_count, scatter_key)
+    data = pack_payload(fields, flags, indices_to_mask(indices), depth)
+    return [
+        (bytes_to_bits(data[:HEADER_SIZE]), 0, header_channels(channel_count), 1, None),
+        (bytes_to_bits(data[HEADER_SIZE:]), HEADER_SIZE * 8, indices, depth, order),
+    ]
 
-    # Convert image to RGB if it's not already in that mode
-    if img.mode != 'RGB':
-        img = img.convert('RGB')
+def layers_end(layers):
+    """Return the index one past the last pixel the bit streams touch."""
+    end = 0
+    for bits, start, channels, depth, order in layers:
+        count = pixels_needed(len(bits), channels, depth)
+        if order is not None and count:
+            end = max(end, start + int(order.take(count).max()) + 1)
+        else:
+            end = max(end, start + count)
+    return end
 
-    encoded_img = img.copy()
+def encode_payload(image, fields, flags=0, channels=None, depth=1, in_place=False, scatter_key=None,
+                   progress=None):
+    """Encodes a binary payload container with the given fields into an image.
+
+    image is a file path or a PIL image. The body is spread over the given
+    channels (e.g. "RGB"; all color channels including alpha by default) using
+    depth low bits per channel. The layout is recorded in the header, which
+    always sits in the blue LSBs of the first pixels.
+
+    The payload is written into a single image buffer: an image opened from a
+    path is modified directly, and with in_place=True so is a caller's image
+    that is already RGB/RGBA. Otherwise one copy is made and returned.
+
+    With a scatter_key (e.g. the HMAC key) the body is scattered over the
+    image in a keyed order; the same key is needed to decode it. progress is
+    an optional hook called with (pixels done, pixels total); see
+    progress.ProgressTracker.
+    """
+    if not isinstance(image, Image.Image):
+        image, in_place = Image.open(image), True
+    # Size and mode come from the header, so an oversized payload fails before any pixels are decoded
+    mode = color_mode(image)
+    pixel_count = image.size[0] * image.size[1]
+    layers = payload_layers(fields, flags, channels, depth, len(mode), pixel_count, scatter_key)
+    if layers_end(layers) > pixel_count:
+        raise ValueError("Message is too large to fit in the image.")
+    with stage("image decode"):
+        img = _writable_image(image, mode, in_place)
+        img.load()
+    with stage("embed"):
+        return _embed_layers(img, layers, progress=progress)
+
+def _strip_reader(img, image_path, mode):
+    """Return rows(top, bottom): a writable (N, W, C) array of source rows in the given mode.
+
+    Uncompressed BMP, PPM and PGM files are read at their row offsets, so
+    each call reads only its own rows. Other formats are decoded whole by
+    Pillow on the first call.
+    """
+    from raw_stego import row_reader  # raw_stego builds on this module, so it is imported late
+    if img.format in ("BMP", "PPM") and mode == "RGB":
+        try:
+            read = row_reader(image_path)
+        except ValueError:  # e.g. a compressed BMP, which Pillow can still decode
+            read = None
+        if read is not None and img.getbands() == ("L",):
+            return lambda top, bottom: np.repeat(read(top, bottom), 3, axis=2)
+        if read is not None:
+            return read
+
+    def rows(top, bottom):
+        strip = img.crop((0, top, img.size[0], bottom))
+        return np.array(strip if strip.mode == mode else strip.convert(mode))
+    return rows
+
+def encode_payload_streamed(image_path, fields, output_path, flags=0, channels=None, depth=1,
+                            strip_rows=STRIP_ROWS, scatter_key=None, progress=None):
+    """Encodes a payload container and writes the stego image as PNG, strip by strip.
+
+    Only one strip of rows is converted to the output mode, modified and
+    compressed at a time; strips past the payload are streamed through
+    untouched. BMP, PPM and PGM sources are read strip by strip through a
+    memory map, so peak memory is about three strips (strip_rows x width x
+    4 bytes each) plus 8 bytes per payload byte for the unpacked bits (about
+    twice that with scatter_key), whatever the image size. Pillow cannot
+    decode other formats in pieces, so for them the decoded source image,
+    in its native mode, is held as well. progress(pixels done, pixels total)
+    is called after each strip if given.
+
+    The PNG is written to a temporary file next to output_path, which only
+    replaces it once every row is written; an error or cancellation leaves
+    any existing file untouched.
+    """
+    img = Image.open(image_path)
+    mode = color_mode(img)
     width, height = img.size
-    message += chr(0)  # Add a null character to indicate the end of the message
-    binary_message = ''.join(format(ord(i), '08b') for i in message)
-
-    data_index = 0
-    for y in range(height):
-        for x in range(width):
-            if data_index < len(binary_message):
-                pixel = list(img.getpixel((x, y)))
-                # Modify the least significant bit of the blue channel
-                pixel[2] = (pixel[2] & ~1) | int(binary_message[data_index])
-                encoded_img.putpixel((x, y), tuple(pixel))
-                data_index += 1
-            else:
-                return encoded_img  # Return the encoded image once done
-
-    return encoded_img
\ No newline at end of file
+    layers = payload_layers(fields, flags, channels, depth, len(mode), width * height, scatter_key)
+    payload_end = layers_end(layers)
+    if payload_end > width * height:
+        raise ValueError("Message is too large to fit in the image.")
+    writers = _window_writers(layers)
+    read_rows = _strip_reader(img, image_path, mode)
+
+    handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(output_path)), suffix=".part")
+    os.close(handle)
+    try:
+        # Decoding, embedding and compressing are interleaved strip by strip, so they are one stage here
+        with stage("embed and save"), PNGStreamWriter(temp_path, width, height, mode) as writer:
+            for top in range(0, height, strip_rows):
+                rows = read_rows(top, min(top + strip_rows, height))
+                if top * width < payload_end:
+                    for write in writers:
+                        write(rows, window_start=top * width)
+                writer.write_rows(rows)
+                if progress is not None:
+                    progress(min(top + strip_rows, height) * width, height * width)
+        # Release the source first, in case it is mapped and output_path replaces it
+        del read_rows
+        img.close()
+        os.replace(temp_path, output_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+def _check_stream_fits(fields, indices, depth, pixel_count):
+    """Raises ValueError unless a streamed container fits; returns its body length."""
+    body_length = stream_body_length(fields)
+    if HEADER_SIZE * 8 + pixels_needed(body_length * 8, indices, depth) > pixel_count:
+        raise ValueError("Message is too large to fit in the image.")
+    return body_length
+
+def write_payload_stream(pixels, fields, flags=0, channels=None, depth=1, scatter_key=None, progress=None):
+    """Writes a container streamed from (field type, length, chunks) triples into an (H, W, C) array.
+
+    The header is built from the announced field lengths and written first;
+    the body then follows chunk by chunk (see lsb_engine.write_stream), so the
+    payload is never held in memory as a whole. progress(pixels done, pixels
+    total) is called after each piece if given.
+    """
+    height, width, channel_count = pixels.shape
+    flags, indices, order = _body_layout(flags, channels, depth, channel_count, width * height, scatter_key)
+    body_length = _check_stream_fits(fields, indices, depth, width * height)
+
+    header = pack_header(body_length, flags, indices_to_mask(indices), depth)
+    write_bits(pixels, bytes_to_bits(header), 0, header_channels(channel_count))
+    write_stream(pixels, iter_body(fields), HEADER_SIZE * 8, indices, depth, order, body_length, progress)
+
+def encode_payload_stream(image, fields, flags=0, channels=None, depth=1, scatter_key=None, progress=None):
+    """Encodes a container streamed from (field type, length, chunks) triples into an image.
+
+    Meant for payloads too large to hold in memory, such as files sealed with
+    envelope.seal_stream. The image is modified as one NumPy array and a new
+    image is returned; the payload itself is only ever held one chunk at a time.
+    """
+    if not isinstance(image, Image.Image):
+        image = Image.open(image)
+    mode = color_mode(image)
+    _, indices, _ = _body_layout(flags, channels, depth, len(mode), 0, None)
+    _check_stream_fits(fields, indices, depth, image.size[0] * image.size[1])
+    with stage("image decode"):
+        pixels = np.array(image.convert(mode) if image.mode != mode else image)
+    with stage("embed"):
+        write_payload_stream(pixels, fields, flags, channels, depth, scatter_key, progress)
+    return Image.fromarray(pixels, mode)
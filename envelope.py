@@ -0,0 +1,288 @@
+import base64
+import os
+import tempfile
+from hmac import compare_digest
+
+from aes import (KDF_SHA256, cbc_length, decrypt, decrypt_bytes, decrypt_cbc_stream, decrypt_gcm, decrypt_gcm_stream,
+                 encrypt_bytes, encrypt_cbc_stream, encrypt_gcm, encrypt_gcm_stream, gcm_length)
+from compression import COMPRESSION_NONE, compress, compress_stream, decompress, decompress_stream
+from hmac_handler import generate_hmac_bytes, new_hmac, verify_hmac, verify_hmac_bytes
+from instrument import stage, timed_chunks
+from payload import (FIELD, FIELD_CIPHERTEXT, FIELD_COMPRESSION, FIELD_KDF, FIELD_KEY, FIELD_MAC, FLAG_AEAD,
+                     FLAG_BINARY, FLAG_BOUND, iter_fields)
+
+# Encryption modes for new payloads
+CIPHER_GCM = "gcm"  # AES-GCM: one pass, 16-byte tag, HMAC key bound as associated data
+CIPHER_CBC = "cbc"  # AES-CBC then HMAC-SHA256 over the raw ciphertext
+CIPHERS = (CIPHER_GCM, CIPHER_CBC)
+
+MAC_SIZE = 32  # Raw HMAC-SHA256 digest
+FILE_CHUNK_SIZE = 1 << 20  # Bytes read from a file at a time when streaming
+
+# Fields read by open_sealed itself rather than passed back as metadata
+SEALED_FIELDS = (FIELD_KEY, FIELD_CIPHERTEXT, FIELD_MAC, FIELD_COMPRESSION, FIELD_KDF)
+# Fields left out of the authenticated records of a FLAG_BOUND payload; every other field is covered
+UNBOUND_FIELDS = (FIELD_KEY, FIELD_CIPHERTEXT, FIELD_MAC)
+
+def _bound(metadata):
+    """Return the bytes that authenticate (field type, value) metadata pairs: their records, in order."""
+    return b"".join(FIELD.pack(field_type, len(value)) + value for field_type, value in metadata)
+
+def seal(message, aes_key, hmac_key, cipher=CIPHER_GCM, compression=COMPRESSION_NONE, kdf=KDF_SHA256, salt=None):
+    """Compresses, encrypts and authenticates message bytes; returns (flags, fields) ready to embed.
+
+    The message is only stored compressed when that makes it smaller; the
+    codec is then recorded in the payload. The compress, encrypt and hmac
+    stages are recorded in the active instrument.Profile, if any.
+
+    kdf selects how the AES key is derived from aes_key (see aes.py); any
+    other than SHA-256 is recorded in the payload. Its salt is drawn per
+    message unless one is given: pass one aes.new_salt(kdf) for a whole
+    batch so the slow derivation runs once per password.
+
+    The recorded codec and KDF are authenticated with the ciphertext (see
+    FLAG_BOUND), so they cannot be stripped or swapped undetected.
+    """
+    fields = {FIELD_KEY: aes_key.encode("utf-8")}
+    if kdf != KDF_SHA256:
+        fields[FIELD_KDF] = kdf.encode("ascii")
+    if compression != COMPRESSION_NONE:
+        with stage("compress"):
+            packed = compress(message, compression)
+        # Keep it only if it still saves space once the codec field is added
+        if len(packed) + FIELD.size + len(compression) < len(message):
+            fields[FIELD_COMPRESSION] = compression.encode("ascii")
+            message = packed
+    settings = [(t, v) for t, v in fields.items() if t not in UNBOUND_FIELDS]
+    bound = _bound(settings)
+    flags = FLAG_BINARY | (FLAG_BOUND if settings else 0)
+    if cipher == CIPHER_GCM:
+        fields[FIELD_CIPHERTEXT] = encrypt_gcm(message, aes_key, hmac_key.encode("utf-8") + bound, kdf, salt)
+        return flags | FLAG_AEAD, fields
+    if cipher == CIPHER_CBC:
+        fields[FIELD_CIPHERTEXT] = encrypt_bytes(message, aes_key, kdf, salt)
+        fields[FIELD_MAC] = generate_hmac_bytes(hmac_key, bound + fields[FIELD_CIPHERTEXT])
+        return flags, fields
+    raise ValueError(f"Unknown cipher mode: {cipher}")
+
+def ciphertext_text(flags, fields):
+    """Return the ciphertext as printable text (base64 for binary payloads)."""
+    ciphertext = fields.get(FIELD_CIPHERTEXT, b"")
+    if flags & FLAG_BINARY:
+        return base64.b64encode(ciphertext).decode("ascii")
+    return ciphertext.decode("utf-8", "replace").strip()
+
+def _check_key(stored_key, aes_key):
+    if stored_key.decode("utf-8", "replace").strip() != aes_key:
+        raise ValueError("Decryption failed: The provided AES key does not match the encryption key.")
+
+def open_sealed(flags, fields, aes_key, hmac_key):
+    """Checks the stored key, verifies and decrypts a payload; returns the message bytes.
+
+    Handles AES-GCM payloads, binary CBC+HMAC payloads and the older
+    base64/hex text payloads (including legacy images). The hmac, decrypt
+    and decompress stages are recorded in the active instrument.Profile.
+    """
+    if FIELD_CIPHERTEXT not in fields or FIELD_KEY not in fields:
+        raise ValueError("Decoded message does not contain a valid ciphertext or key.")
+    _check_key(fields[FIELD_KEY], aes_key)
+    kdf = _kdf(fields)
+
+    bound = b""
+    if flags & FLAG_BOUND:
+        bound = _bound((t, v) for t, v in fields.items() if t not in UNBOUND_FIELDS)
+
+    if flags & FLAG_AEAD:
+        message = decrypt_gcm(fields[FIELD_CIPHERTEXT], aes_key, hmac_key.encode("utf-8") + bound, kdf)
+        return _decompressed(fields, message)
+
+    if FIELD_MAC not in fields:
+        raise ValueError("Decoded message does not contain a valid ciphertext or key.")
+    if flags & FLAG_BINARY:
+        ciphertext, hmac_value, verify = fields[FIELD_CIPHERTEXT], fields[FIELD_MAC], verify_hmac_bytes
+        authenticated = bound + ciphertext
+    else:
+        try:
+            ciphertext = fields[FIELD_CIPHERTEXT].decode("utf-8").strip()
+            hmac_value = fields[FIELD_MAC].decode("utf-8").strip()
+        except UnicodeDecodeError:
+            raise ValueError("Decoded message does not contain a valid ciphertext or key.")
+        verify, authenticated = verify_hmac, ciphertext
+
+    if not verify(hmac_key, authenticated, hmac_value):
+        raise ValueError("HMAC verification failed: The message has been tampered with or the key is incorrect.")
+    if flags & FLAG_BINARY:
+        return _decompressed(fields, decrypt_bytes(ciphertext, aes_key, kdf))
+    return decrypt(ciphertext, aes_key).encode("utf-8")
+
+def _kdf(fields):
+    """Return the key derivation function recorded in the fields (SHA-256 when absent)."""
+    if FIELD_KDF not in fields:
+        return KDF_SHA256
+    return fields[FIELD_KDF].decode("ascii", "replace")
+
+def _compression(fields):
+    """Return the codec recorded in the fields, or None."""
+    if FIELD_COMPRESSION not in fields:
+        return None
+    return fields[FIELD_COMPRESSION].decode("ascii", "replace")
+
+def _decompressed(fields, message):
+    """Undoes the compression recorded in the fields, if any."""
+    compression = _compression(fields)
+    if compression is None:
+        return message
+    with stage("decompress"):
+        return decompress(message, compression)
+
+def file_chunks(source, chunk_size=FILE_CHUNK_SIZE):
+    """Yields the contents of a path or binary file object chunk by chunk."""
+    if isinstance(source, (str, bytes, os.PathLike)):
+        with open(source, "rb") as f:
+            yield from file_chunks(f, chunk_size)
+        return
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+def _mac_chunks(chunks, mac):
+    """Passes chunks through, feeding each one to an HMAC object."""
+    for chunk in chunks:
+        mac.update(chunk)
+        yield chunk
+
+def _digest(mac):
+    """Yields the digest once every chunk before it has been streamed."""
+    yield mac.digest()
+
+def _spool(chunks):
+    """Writes chunks to a temporary file that stays in memory up to FILE_CHUNK_SIZE; returns (file, size)."""
+    spool = tempfile.SpooledTemporaryFile(max_size=FILE_CHUNK_SIZE)
+    for chunk in chunks:
+        spool.write(chunk)
+    size = spool.tell()
+    spool.seek(0)
+    return spool, size
+
+def _spooled_chunks(spool):
+    """Yields the contents of a spool file and closes it once they are exhausted."""
+    try:
+        yield from file_chunks(spool)
+    finally:
+        spool.close()
+
+def seal_stream(chunks, length, aes_key, hmac_key, cipher=CIPHER_GCM, compression=COMPRESSION_NONE,
+                kdf=KDF_SHA256, salt=None, metadata=(), reopen=None):
+    """Streaming seal() for large payloads; returns (flags, fields) as (field type, length, chunks) triples.
+
+    length is the total size of the plaintext chunks (e.g. the file size), so
+    the container can be sized before anything is encrypted. Encryption and
+    MAC run lazily as the fields are iterated, one chunk at a time; the MAC
+    field follows the ciphertext so it is ready by the time it is reached.
+    With compression the chunks are compressed up front into a temporary
+    file, since the container needs the compressed length. As in seal(),
+    compression is only kept when it makes the payload smaller; that needs
+    the plaintext a second time, so it applies when reopen is given, a
+    callable returning a fresh iterator of the same chunks (e.g. re-reading
+    a file). kdf and salt are as for seal().
+
+    metadata is a list of (field type, value bytes) pairs, such as a file
+    name and size, written first. They are authenticated with the
+    ciphertext, along with the recorded codec and KDF: as GCM associated
+    data, or ahead of the ciphertext in the HMAC.
+    """
+    settings = []
+    if kdf != KDF_SHA256:
+        settings.append((FIELD_KDF, kdf.encode("ascii")))
+    if compression != COMPRESSION_NONE:
+        with stage("compress"):
+            spool, packed_length = _spool(compress_stream(chunks, compression))
+        if reopen is not None and packed_length + FIELD.size + len(compression) >= length:
+            spool.close()
+            chunks = reopen()
+        else:
+            chunks, length = _spooled_chunks(spool), packed_length
+            settings.append((FIELD_COMPRESSION, compression.encode("ascii")))
+
+    key = aes_key.encode("utf-8")
+    fields = [(field_type, len(value), [value]) for field_type, value in metadata]
+    fields.append((FIELD_KEY, len(key), [key]))
+    fields += [(field_type, len(value), [value]) for field_type, value in settings]
+    bound = _bound(list(metadata) + settings)
+    flags = FLAG_BINARY | (FLAG_BOUND if bound else 0)
+
+    if cipher == CIPHER_GCM:
+        ciphertext = encrypt_gcm_stream(chunks, aes_key, hmac_key.encode("utf-8") + bound, kdf, salt)
+        ciphertext = timed_chunks("encrypt", ciphertext)
+        return flags | FLAG_AEAD, fields + [(FIELD_CIPHERTEXT, gcm_length(length, kdf), ciphertext)]
+    if cipher == CIPHER_CBC:
+        mac = new_hmac(hmac_key)
+        mac.update(bound)
+        ciphertext = timed_chunks("encrypt", encrypt_cbc_stream(chunks, aes_key, kdf, salt))
+        return flags, fields + [
+            (FIELD_CIPHERTEXT, cbc_length(length, kdf), timed_chunks("hmac", _mac_chunks(ciphertext, mac))),
+            (FIELD_MAC, MAC_SIZE, _digest(mac)),
+        ]
+    raise ValueError(f"Unknown cipher mode: {cipher}")
+
+def open_sealed_stream(flags, body_chunks, aes_key, hmac_key, metadata=None):
+    """Streaming open_sealed(): yields the message in chunks from a streamed container body.
+
+    Authentication completes only at the end of the stream, so discard
+    whatever was yielded if this raises. Text-mode payloads are small and
+    are opened in one piece. Fields other than the key, ciphertext and MAC
+    (e.g. a file name) are collected into the metadata dict if one is given;
+    with FLAG_BOUND they, the codec and the KDF are authenticated along with
+    the ciphertext.
+    """
+    if not flags & FLAG_BINARY:
+        fields = {field_type: b"".join(value) for field_type, _, value in iter_fields(body_chunks)}
+        if metadata is not None:
+            metadata.update((t, v) for t, v in fields.items() if t not in SEALED_FIELDS)
+        yield open_sealed(flags, fields, aes_key, hmac_key)
+        return
+
+    key_checked = opened = False
+    mac = compression = None
+    kdf = KDF_SHA256
+    bound = []  # Records of the authenticated fields read so far
+    for field_type, _, value in iter_fields(body_chunks):
+        if field_type not in UNBOUND_FIELDS:
+            value = [b"".join(value)]
+            if bound is None and flags & FLAG_BOUND:
+                raise ValueError("Decoded message has a field after the ciphertext, outside its authentication.")
+            if bound is not None:
+                bound.append(FIELD.pack(field_type, len(value[0])) + value[0])
+
+        if field_type == FIELD_KEY:
+            _check_key(b"".join(value), aes_key)
+            key_checked = True
+        elif field_type == FIELD_COMPRESSION:
+            compression = value[0].decode("ascii", "replace")
+        elif field_type == FIELD_KDF:
+            kdf = value[0].decode("ascii", "replace")
+        elif field_type == FIELD_CIPHERTEXT and key_checked:
+            associated = b"".join(bound) if flags & FLAG_BOUND else b""
+            bound = None
+            if flags & FLAG_AEAD:
+                message = decrypt_gcm_stream(value, aes_key, hmac_key.encode("utf-8") + associated, kdf)
+            else:
+                mac = new_hmac(hmac_key)
+                mac.update(associated)
+                value = timed_chunks("hmac", _mac_chunks(value, mac))
+                message = decrypt_cbc_stream(value, aes_key, kdf)
+            message = timed_chunks("decrypt", message)
+            if compression:
+                message = timed_chunks("decompress", decompress_stream(message, compression))
+            yield from message
+            opened = bool(flags & FLAG_AEAD)
+        elif field_type == FIELD_MAC and mac is not None:
+            if not compare_digest(mac.digest(), b"".join(value)):
+                raise ValueError("HMAC verification failed: The message has been tampered with or the key is incorrect.")
+            opened = True
+        elif field_type not in SEALED_FIELDS and metadata is not None:
+            metadata[field_type] = value[0]
+    if not opened:
+        raise ValueError("Decoded message does not contain a valid ciphertext or key.")
@@ -0,0 +1,79 @@
+import os
+import struct
+import tempfile
+
+from aes import KDF_SHA256
+from compression import COMPRESSION_NONE
+from decode_lsb import decode_payload_stream
+from encode_lsb import encode_payload_stream
+from envelope import CIPHER_GCM, file_chunks, open_sealed_stream, seal_stream
+from instrument import stage, timed_chunks
+from payload import FIELD_FILE_SIZE, FIELD_FILENAME
+
+FILE_SIZE = struct.Struct(">Q")
+
+def hide_file(image_path, file_path, output_path, aes_key, hmac_key, cipher=CIPHER_GCM, channels=None, depth=1,
+              scatter=False, compression=COMPRESSION_NONE, progress=None, kdf=KDF_SHA256):
+    """Encrypts a file of any type and hides it, with its name and size, in an image saved as PNG.
+
+    The file is read, encrypted and embedded chunk by chunk as raw bytes, so
+    it is never held in memory whole. With scatter=True the payload pixels
+    follow an order keyed by the HMAC key. compression is applied to the
+    file before encryption. kdf selects the key derivation, which extract_file
+    reads back from the payload. progress(pixels done, pixels total) is called
+    as the payload is embedded.
+    """
+    size = os.path.getsize(file_path)
+    name = os.path.basename(file_path).encode("utf-8")
+    # The name and size are authenticated with the ciphertext, so neither can be swapped undetected
+    metadata = [(FIELD_FILENAME, name), (FIELD_FILE_SIZE, FILE_SIZE.pack(size))]
+    def read_file():
+        return timed_chunks("read file", file_chunks(file_path))
+    flags, fields = seal_stream(read_file(), size, aes_key, hmac_key, cipher, compression, kdf,
+                                metadata=metadata, reopen=read_file)
+
+    encoded_img = encode_payload_stream(image_path, fields, flags, channels, depth,
+                                        hmac_key if scatter else None, progress)
+    with stage("save"):
+        encoded_img.save(output_path, format="PNG")
+    return size
+
+def _safe_name(stored_name):
+    """Return a file name from the payload that cannot point outside the output directory."""
+    name = os.path.basename(stored_name.decode("utf-8", "replace").replace("\\", "/"))
+    if name in ("", ".", ".."):
+        raise ValueError("The payload does not contain a valid file name.")
+    return name
+
+def extract_file(image_path, output_dir, aes_key, hmac_key, output_name=None, progress=None):
+    """Extracts, verifies and decrypts a file hidden with hide_file; returns the path written.
+
+    The file is decrypted chunk by chunk into a temporary file next to the
+    destination, which only replaces it once authentication has succeeded.
+    It is saved under its stored name unless output_name is given.
+    progress(pixels done, pixels total) is called as the payload is read.
+    """
+    flags, body = decode_payload_stream(image_path, scatter_key=hmac_key, progress=progress)
+    os.makedirs(output_dir, exist_ok=True)
+
+    metadata = {}
+    handle, temp_path = tempfile.mkstemp(dir=output_dir, suffix=".part")
+    try:
+        written = 0
+        # The pixels are read and decrypted only as the chunks are written here
+        with stage("extract"), os.fdopen(handle, "wb") as f:
+            for chunk in open_sealed_stream(flags, body, aes_key, hmac_key, metadata):
+                f.write(chunk)
+                written += len(chunk)
+
+        if FIELD_FILENAME not in metadata:
+            raise ValueError("The image holds a message, not a file.")
+        if FIELD_FILE_SIZE in metadata and FILE_SIZE.unpack(metadata[FIELD_FILE_SIZE])[0] != written:
+            raise ValueError("Extracted file size does not match the size recorded in the payload.")
+
+        output_path = os.path.join(output_dir, output_name or _safe_name(metadata[FIELD_FILENAME]))
+        os.replace(temp_path, output_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return output_path
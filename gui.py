@@ -2,13 +2,112 @@ import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 from PIL import ImageTk, Image
 import os
+import queue
+import threading
+
+from encode_lsb import encode_payload
+from decode_lsb import decode_payload
+from capacity import plan
+from compression import COMPRESSIONS
+from envelope import CIPHER_CBC, CIPHER_GCM, ciphertext_text, open_sealed, seal
+from image_probe import probe_image
+from progress import Cancelled, ProgressTracker
+from utils import calculate_image_properties, can_message_fit
+
+
+def thumbnail_photo(image_path, size=(300, 300)):
+    """Decode an image straight to thumbnail size for display (JPEGs are decoded at reduced scale)."""
+    with Image.open(image_path) as img:
+        img.thumbnail(size)
+        return ImageTk.PhotoImage(img)
+
+class BackgroundTask:
+    """Runs work(progress) on a worker thread and hands its progress and result back to the Tk thread.
+
+    Tk may only be touched from the main thread, so the worker just queues
+    messages and the window polls the queue with after().
+    """
+    POLL_MS = 50
+
+    def __init__(self, widget, work, on_progress, on_done):
+        self.widget = widget
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.queue = queue.Queue()
+        self.progress = ProgressTracker(lambda done, total, eta: self.queue.put(("progress", (done, total, eta))))
+        threading.Thread(target=self._run, args=(work,), daemon=True).start()
+        self.widget.after(self.POLL_MS, self._poll)
+
+    def cancel(self):
+        self.progress.cancel()
+
+    def _run(self, work):
+        try:
+            self.queue.put(("done", (work(self.progress), None)))
+        except Exception as e:
+            self.queue.put(("done", (None, e)))
 
-from encode_lsb import encode_lsb
-from decode_lsb import decode_lsb
-from aes import encrypt, decrypt
-from hmac_handler import generate_hmac, verify_hmac
-from utils import can_message_fit
-
+    def _poll(self):
+        try:
+            while True:
+                kind, args = self.queue.get_nowait()
+                if kind == "done":
+                    self.on_done(*args)
+                    return
+                self.on_progress(*args)
+        except queue.Empty:
+            pass
+        try:
+            self.widget.after(self.POLL_MS, self._poll)
+        except tk.TclError:
+            self.cancel()  # The window was closed
+
+class ProgressPanel:
+    """Progress bar, status line and cancel button for background work, in three grid rows from row."""
+
+    def __init__(self, parent, row, action_button, bg, fg, button_style):
+        self.action_button = action_button
+        self.task = None
+
+        self.bar = ttk.Progressbar(parent, mode="determinate", maximum=100)
+        self.bar.grid(row=row, column=0, pady=5, sticky="ew")
+
+        self.status_label = tk.Label(parent, text="", bg=bg, font=("Arial", 12), fg=fg, anchor="center")
+        self.status_label.grid(row=row + 1, column=0, pady=5, sticky="ew")
+
+        self.cancel_button = tk.Button(parent, text="Cancel", command=self.cancel, state=tk.DISABLED, **button_style)
+        self.cancel_button.grid(row=row + 2, column=0, pady=5)
+
+    def start(self, work, on_done, status):
+        """Runs work(progress) in the background; on_done(result, error) is called on the Tk thread unless cancelled."""
+        self.bar["value"] = 0
+        self.status_label.config(text=status)
+        self.action_button.config(state=tk.DISABLED)
+        self.cancel_button.config(state=tk.NORMAL)
+        self.task = BackgroundTask(self.bar, work, self.show_progress,
+                                   lambda result, error: self._finish(on_done, result, error))
+
+    def show_progress(self, done, total, eta):
+        self.bar["value"] = 100 * done / max(total, 1)
+        eta_text = f", about {eta:.0f} s left" if eta is not None and done < total else ""
+        self.status_label.config(text=f"{done:,} of {total:,} pixels{eta_text}")
+
+    def cancel(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.status_label.config(text="Cancelling...")
+
+    def _finish(self, on_done, result, error):
+        self.task = None
+        self.action_button.config(state=tk.NORMAL)
+        self.cancel_button.config(state=tk.DISABLED)
+        if isinstance(error, Cancelled):
+            self.bar["value"] = 0
+            self.status_label.config(text="Cancelled.")
+            return
+        self.bar["value"] = 100 if error is None else 0
+        self.status_label.config(text="Done." if error is None else "Failed.")
+        on_done(result, error)
 
 class SteganographyApp:
     def __init__(self, master):
@@ -131,13 +230,13 @@ class EncodeWindow:
         self.scrollbar.pack(side="right", fill="y")
 
         # Configure grid layout for the scrollable frame
-        for i in range(15):  # Configure 15 rows
+        for i in range(23):  # Configure 23 rows
             self.scrollable_frame.grid_rowconfigure(i, weight=0)
         self.scrollable_frame.grid_columnconfigure(0, weight=1)
 
         # Image Selection
         self.image_path = ""
-        self.image = None  # Store the loaded image
+        self.image_info = None  # Header facts of the selected image; its pixels are only decoded to encode
 
         self.image_label = tk.Label(self.scrollable_frame, text="Select an image:", bg="#F0E68C", font=("Times", 14), fg="#654321", anchor="center")  
         self.image_label.grid(row=0, column=0, pady=10, sticky="ew")
@@ -165,62 +264,89 @@ class EncodeWindow:
         self.method_label = tk.Label(self.scrollable_frame, text="Select Encoding Method:", bg="#F0E68C", font=("Times", 14), fg="#654321", anchor="center") 
         self.method_label.grid(row=4, column=0, pady=5, sticky="ew")
 
-        self.encoding_method = ttk.Combobox(self.scrollable_frame ,values=["Normal LSB"], justify='center')
+        self.encoding_method = ttk.Combobox(self.scrollable_frame ,values=["Normal LSB", "Keyed Scatter LSB"], justify='center')
         self.encoding_method.current(0)
         self.encoding_method.grid(row=5, column=0, pady=5 ,sticky="ew")
+
+        # Encryption mode: AES-GCM authenticates in the same pass, CBC is followed by an HMAC
+        self.cipher_label = tk.Label(self.scrollable_frame, text="Select Encryption Mode:", bg="#F0E68C", font=("Times", 14), fg="#654321", anchor="center")
+        self.cipher_label.grid(row=6, column=0, pady=5, sticky="ew")
+
+        self.cipher_modes = {"AES-GCM (authenticated)": CIPHER_GCM, "AES-CBC + HMAC": CIPHER_CBC}
+        self.cipher_mode = ttk.Combobox(self.scrollable_frame, values=list(self.cipher_modes), justify='center')
+        self.cipher_mode.current(0)
+        self.cipher_mode.grid(row=7, column=0, pady=5, sticky="ew")
+        self.cipher_mode.bind("<<ComboboxSelected>>", lambda event: self.update_char_limit())
+
+        # Optional compression before encryption; it is only kept when it makes the payload smaller
+        self.compression_label = tk.Label(self.scrollable_frame, text="Select Compression:", bg="#F0E68C", font=("Times", 14), fg="#654321", anchor="center")
+        self.compression_label.grid(row=8, column=0, pady=5, sticky="ew")
+
+        self.compression_method = ttk.Combobox(self.scrollable_frame, values=list(COMPRESSIONS), justify='center')
+        self.compression_method.current(0)
+        self.compression_method.grid(row=9, column=0, pady=5, sticky="ew")
         
         # HMAC Key Input and Dropdown
         self.hmac_key_label = tk.Label(self.scrollable_frame, text="Select or Enter HMAC Key:", bg="#F0E68C", font=("Times", 14), fg="#654321", anchor="center")
-        self.hmac_key_label.grid(row=6, column=0, pady=5, sticky="ew")
+        self.hmac_key_label.grid(row=10, column=0, pady=5, sticky="ew")
 
         self.hmac_key_options = ["", "DemoHMACKey-1-ForTestingPurposes", "DemoHMACKey-2-ForTestingPurposes"]  # Demo HMAC keys
         self.hmac_key_var = tk.StringVar()
         self.hmac_key_dropdown = ttk.Combobox(self.scrollable_frame, textvariable=self.hmac_key_var, values=self.hmac_key_options, justify='center')
-        self.hmac_key_dropdown.grid(row=7, column=0, pady=5, sticky="ew")
+        self.hmac_key_dropdown.grid(row=11, column=0, pady=5, sticky="ew")
 
         # AES Key Input and Dropdown
         self.aes_key_label = tk.Label(self.scrollable_frame, text="Select or Enter AES Key (16, 24, or 32 characters):", bg="#F0E68C", font=("Times", 14), fg="#654321", anchor="center")
-        self.aes_key_label.grid(row=8, column=0, pady=5, sticky="ew")
+        self.aes_key_label.grid(row=12, column=0, pady=5, sticky="ew")
 
         self.aes_key_options = ["", "Sixteen byte key", "TwentyFourByteKey1234567", "ThirtyTwoByteKey1234567890123456"]  # Demo AES keys
         self.aes_key_var = tk.StringVar()
         self.aes_key_dropdown = ttk.Combobox(self.scrollable_frame, textvariable=self.aes_key_var, values=self.aes_key_options, justify='center')
-        self.aes_key_dropdown.grid(row=9, column=0, pady=5, sticky="ew")
+        self.aes_key_dropdown.grid(row=13, column=0, pady=5, sticky="ew")
 
         # Secret message input
         self.message_label = tk.Label(self.scrollable_frame, text="Enter Message:", bg="#F0E68C", font=("Times", 14), fg="#654321", anchor="center") 
-        self.message_label.grid(row=10, column=0, pady=(10, 5), sticky="ew")
+        self.message_label.grid(row=14, column=0, pady=(10, 5), sticky="ew")
 
         self.message_entry = tk.Text(self.scrollable_frame, height=5, font=("Arial", 12))
-        self.message_entry.grid(row=11, column=0, pady=(5, 10), sticky="ew")
+        self.message_entry.grid(row=15, column=0, pady=(5, 10), sticky="ew")
 
         # Dynamic character limit display label
         self.char_limit_label = tk.Label(self.scrollable_frame, text="", bg="#F0E68C", font=("Arial", 12), fg="#FF5733")
-        self.char_limit_label.grid(row=12, column=0, pady=(5, 10), sticky="ew")
+        self.char_limit_label.grid(row=16, column=0, pady=(5, 10), sticky="ew")
 
         # Update character limit when message is typed
         self.message_entry.bind("<KeyRelease>", lambda event: self.update_char_limit())
 
         # Ciphertext display field
         self.ciphertext_label = tk.Label(self.scrollable_frame, text="Ciphertext:", bg="#F0E68C", font=("Times", 14), fg="#654321", anchor="center") 
-        self.ciphertext_label.grid(row=13, column=0, pady=(10, 5), sticky="ew")
+        self.ciphertext_label.grid(row=17, column=0, pady=(10, 5), sticky="ew")
 
         self.ciphertext_display = tk.Text(self.scrollable_frame, height=3, font=("Arial", 12))
-        self.ciphertext_display.grid(row=14, column=0, pady=(5, 20), sticky="ew")
+        self.ciphertext_display.grid(row=18, column=0, pady=(5, 20), sticky="ew")
 
         # Save Button
         self.save_button = tk.Button(self.scrollable_frame, text="Save Encoded Image", command=self.save_encoded_image, **button_style)
-        self.save_button.grid(row=15,column=0,pady=20)
+        self.save_button.grid(row=19,column=0,pady=20)
+
+        # Embedding runs on a worker thread with progress, an ETA and a cancel button
+        self.progress_panel = ProgressPanel(self.scrollable_frame, 20, self.save_button, "#F0E68C", "#654321", button_style)
+
+    def capacity_plan(self, message):
+        # Exact payload size for the selected cipher, including the IV/nonce, padding, MAC and stored key
+        return plan(self.image_info.width, self.image_info.height, len(message.encode('utf-8')),
+                    cipher=self.cipher_modes[self.cipher_mode.get()], channel_count=self.image_info.channel_count,
+                    key_length=len(self.aes_key_var.get().encode('utf-8')) or 16)
 
     def update_char_limit(self):
-        if not self.image:
+        if not self.image_info:
             self.char_limit_label.config(text="Select an image to see character limits.")
             return
 
         message_text = self.message_entry.get("1.0", "end-1c")
     
-        # Calculate theoretical maximum characters that can fit in the image
-        theoretical_max_chars = (self.image.size[0] * self.image.size[1] * 3) // 8 - 1
+        # Calculate theoretical maximum characters (UTF-8 bytes) that can fit in the image
+        theoretical_max_chars = self.capacity_plan(message_text).max_message_bytes
 
         # Apply a conservative factor to minimize noticeable quality loss (e.g., 25%)
         conservative_factor = 0.25  # Reduce usable capacity to 25% to preserve image quality
@@ -230,14 +356,15 @@ class EncodeWindow:
         remaining_text_message = f"Recommended characters: {recommended_max_chars}. "
     
         # Calculate how many characters can still be entered before reaching the limit
-        chars_left = recommended_max_chars - len(message_text)
+        message_length = len(message_text.encode('utf-8'))
+        chars_left = recommended_max_chars - message_length
     
         if chars_left < 0:
             chars_left = 0
         
         remaining_text_message += f"You can still enter {chars_left} characters before noticeable quality loss."
     
-        if len(message_text) >= recommended_max_chars:
+        if message_length >= recommended_max_chars:
             remaining_text_message += " (Reaching limit!)"
 
         self.char_limit_label.config(text=f"{remaining_text_message}")
@@ -247,25 +374,20 @@ class EncodeWindow:
         file_path = filedialog.askopenfilename(filetypes=[("Image Files", "*.png;*.jpg")])
 
         if file_path:
-            self.image = Image.open(file_path)  # Store the image
-            original_width, original_height = self.image.size  # Store original size for properties display
-            image = self.image.copy()  # Create a copy for thumbnail
-            image.thumbnail((300, 300))
-            photo = ImageTk.PhotoImage(image)
+            self.image_info = probe_image(file_path)  # Header only; cached for the capacity checks
+            photo = thumbnail_photo(file_path)
             self.image_display.config(image=photo)
             self.image_display.image = photo  # Keep a reference to avoid garbage collection
 
             # Display actual image properties
-            size = os.path.getsize(file_path) / 1024  # Size in KB
-            resolution = f"{original_width} x {original_height}"  # Use original resolution
-            num_pixels = original_width * original_height
+            properties = calculate_image_properties(self.image_info)
 
             properties_text = (
                 f"Image Name: {os.path.basename(file_path)}\n"
                 f"Path: {file_path}\n"
-                f"Size: {size:.2f} KB\n"
-                f"Resolution: {resolution}\n"
-                f"Number of Pixels: {num_pixels}"
+                f"Size: {properties['size']:.2f} KB\n"
+                f"Resolution: {properties['resolution']}\n"
+                f"Number of Pixels: {properties['num_pixels']}"
             )
             self.properties_label.config(text=properties_text)
             self.image_path = file_path
@@ -291,38 +413,49 @@ class EncodeWindow:
             messagebox.showerror("Error", "Please provide a message and select an image.")
             return
         
-        # Calculate theoretical maximum characters that can fit in the image
-        theoretical_max_chars = (self.image.size[0] * self.image.size[1] * 3) // 8 - 1
+        # Calculate theoretical maximum characters (UTF-8 bytes) that can fit in the image
+        theoretical_max_chars = self.capacity_plan(message).max_message_bytes
 
         # Apply a conservative factor to minimize noticeable quality loss (e.g., 25%)
         conservative_factor = 0.25  
-        recommended_max_chars = int(theoretical_max_chars * conservative_factor) - len(message)
+        recommended_max_chars = int(theoretical_max_chars * conservative_factor) - len(message.encode('utf-8'))
 
         if recommended_max_chars < 0:
             messagebox.showerror("Error", "The message is too large to fit in the image without noticeable quality loss.")
             return
 
-        # Generate ciphertext here for saving and print to terminal
-        ciphertext = encrypt(message, aes_key).decode('utf-8')
-
-        print(f"Key: {aes_key}")  
-        print(f"Ciphertext: {ciphertext}")  
+        save_path = filedialog.asksaveasfilename(defaultextension=".png",
+                                               filetypes=[("PNG files", "*.png"), ("JPEG files", "*.jpg")])
+        if not save_path:
+            return
 
-        # Generate HMAC of the ciphertext
-        hmac_value = generate_hmac(hmac_key, ciphertext)
+        # Read every widget here: the work below runs on a worker thread and must not touch Tk
+        image_path = self.image_path
+        cipher = self.cipher_modes[self.cipher_mode.get()]
+        compression = self.compression_method.get()
+        scatter_key = hmac_key if self.encoding_method.get() == "Keyed Scatter LSB" else None
 
-        # Display ciphertext in the GUI
-        self.ciphertext_display.delete("1.0", tk.END)  
-        self.ciphertext_display.insert(tk.END, ciphertext)  
+        def work(progress):
+            # Encrypt and authenticate into raw bytes; base64 is only used for display
+            flags, fields = seal(message.encode('utf-8'), aes_key, hmac_key, cipher, compression)
+            encoded_img = encode_payload(image_path, fields, flags=flags, scatter_key=scatter_key, progress=progress)
+            encoded_img.save(save_path)
+            return ciphertext_text(flags, fields)
 
-        encoded_img = encode_lsb(self.image_path, ciphertext + "\n" + hmac_value + "\n" + aes_key)
+        def done(ciphertext, error):
+            if error is not None:
+                messagebox.showerror("Error", str(error))
+                return
 
-        save_path = filedialog.asksaveasfilename(defaultextension=".png",
-                                               filetypes=[("PNG files", "*.png"), ("JPEG files", "*.jpg")])
+            print(f"Key: {aes_key}")  
+            print(f"Ciphertext: {ciphertext}")  
 
-        if save_path and encoded_img:
-            encoded_img.save(save_path)
+            # Display ciphertext in the GUI
+            self.ciphertext_display.delete("1.0", tk.END)  
+            self.ciphertext_display.insert(tk.END, ciphertext)  
             messagebox.showinfo("Success", "Image saved successfully!")
+
+        self.progress_panel.start(work, done, "Encrypting and embedding...")
 class DecodeWindow:
     def __init__(self, master):
         self.window = tk.Toplevel(master)
@@ -354,7 +487,7 @@ class DecodeWindow:
         self.scrollbar.pack(side="right", fill="y")
 
         # Configure grid layout for the scrollable frame
-        for i in range(13):  # Configure 13 rows
+        for i in range(16):  # Configure 16 rows
             self.scrollable_frame.grid_rowconfigure(i, weight=0)
         self.scrollable_frame.grid_columnconfigure(0, weight=1)
 
@@ -415,12 +548,15 @@ class DecodeWindow:
         self.decode_button = tk.Button(self.scrollable_frame, text="Decode Message", command=self.decode_message, **button_style)
         self.decode_button.grid(row=10, column=0, pady=20)
 
+        # Decoding runs on a worker thread with progress, an ETA and a cancel button
+        self.progress_panel = ProgressPanel(self.scrollable_frame, 11, self.decode_button, "#ADD8E6", "#000080", button_style)
+
         # Display Decoded Message and Ciphertext
         self.decoded_message_label = tk.Label(self.scrollable_frame, text="Decoded Message:", bg="#ADD8E6", font=("Times", 14), fg="#000080", anchor="center")
-        self.decoded_message_label.grid(row=11, column=0, pady=5, sticky="ew")
+        self.decoded_message_label.grid(row=14, column=0, pady=5, sticky="ew")
 
         self.decoded_message_display = tk.Text(self.scrollable_frame, height=10, font=("Arial", 12))
-        self.decoded_message_display.grid(row=12, column=0, pady=5, sticky="nsew")
+        self.decoded_message_display.grid(row=15, column=0, pady=5, sticky="nsew")
 
         # Configure columns to center content 
         for i in range(self.scrollable_frame.grid_size()[0]):
@@ -443,24 +579,19 @@ class DecodeWindow:
          file_path = filedialog.askopenfilename(filetypes=[("Image Files","*.png;*.jpg")])
 
          if file_path:
-             original_image = Image.open(file_path)
-             original_width , original_height = original_image.size
+             # Header facts for the panel; the pixels are decoded once for the thumbnail and once to decode
+             properties = calculate_image_properties(file_path)
 
-             original_image.thumbnail((300 ,300))
-             photo = ImageTk.PhotoImage(original_image)
+             photo = thumbnail_photo(file_path)
              self.image_display.config(image=photo)
              self.image_display.image = photo
 
-             size = os.path.getsize(file_path) / 1024 
-             resolution = f"{original_width} x {original_height}"
-             num_pixels = original_width * original_height
-
              properties_text = (
                  f"Encoded Image Name: {os.path.basename(file_path)}\n"
                  f"Path: {file_path}\n"
-                 f"Size: {size:.2f} KB\n"
-                 f"Resolution: {resolution}\n"
-                 f"Number of Pixels: {num_pixels}"
+                 f"Size: {properties['size']:.2f} KB\n"
+                 f"Resolution: {properties['resolution']}\n"
+                 f"Number of Pixels: {properties['num_pixels']}"
              )
              self.properties_label.config(text=properties_text)
              self.encoded_image_path = file_path
@@ -481,24 +612,27 @@ class DecodeWindow:
              messagebox.showerror("Error","Please provide an HMAC key.")
              return
 
-         try:
-             original_message,hmac_value ,stored_key = decode_lsb(self.encoded_image_path)
-
-             if stored_key.strip() != aes_key:
-                 raise ValueError("Decryption failed: The provided AES key does not match the encryption key.")
+         encoded_image_path = self.encoded_image_path
 
-             if not verify_hmac(hmac_key ,original_message.strip() ,hmac_value.strip()):
-                 raise ValueError("HMAC verification failed: The message has been tampered with or the key is incorrect.")
+         def work(progress):
+             # Runs on a worker thread: no Tk calls in here
+             # Scattered payloads are detected from the header and use the HMAC key
+             flags ,fields = decode_payload(encoded_image_path, scatter_key=hmac_key, progress=progress)
 
-             decrypted_message = decrypt(original_message.strip() ,aes_key)
+             # The payload header says whether this is AES-GCM, CBC+HMAC or the older text format
+             decrypted_message = open_sealed(flags ,fields ,aes_key ,hmac_key).decode('utf-8')
+             original_message = ciphertext_text(flags ,fields)
 
-             full_decoded_message=f"Decrypted Message:\n{decrypted_message}\nCiphertext:\n{original_message.strip()}"
+             return f"Decrypted Message:\n{decrypted_message}\nCiphertext:\n{original_message}"
 
-             # Display decoded message in the text area
-             self.decoded_message_display.delete("1.0" ,tk.END)
-             self.decoded_message_display.insert(tk.END ,full_decoded_message)
+         def done(full_decoded_message, error):
+             if isinstance(error, ValueError):
+                 messagebox.showerror("Decoding Error" ,str(error))
+             elif error is not None:
+                 messagebox.showerror("Decoding Error" ,"An error occurred during decryption: " + str(error))
+             else:
+                 # Display decoded message in the text area
+                 self.decoded_message_display.delete("1.0" ,tk.END)
+                 self.decoded_message_display.insert(tk.END ,full_decoded_message)
 
-         except ValueError as ve:
-             messagebox.showerror("Decoding Error" ,str(ve))
-         except Exception as e:
-             messagebox.showerror("Decoding Error" ,"An error occurred during decryption: " + str(e))
+         self.progress_panel.start(work, done, "Extracting and decrypting...")
@@ -2,6 +2,9 @@
 import hmac
 import hashlib
 
+from instrument import instrumented
+
+@instrumented("hmac")
 def generate_hmac(key, message):
     """Generates an HMAC-SHA256 hash of the message using the given key."""
     key_bytes = key.encode('utf-8')
@@ -13,3 +16,16 @@ def verify_hmac(key, message, hmac_value):
     """Verifies the HMAC-SHA256 hash of the message against the given HMAC value."""
     generated_hmac = generate_hmac(key, message)
     return hmac.compare_digest(generated_hmac, hmac_value)  # Secure comparison
+
+@instrumented("hmac")
+def generate_hmac_bytes(key, data):
+    """Generates the raw 32-byte HMAC-SHA256 digest of binary data using the given key."""
+    return hmac.new(key.encode('utf-8'), data, hashlib.sha256).digest()
+
+def verify_hmac_bytes(key, data, hmac_value):
+    """Verifies a raw HMAC-SHA256 digest of binary data."""
+    return hmac.compare_digest(generate_hmac_bytes(key, data), hmac_value)
+
+def new_hmac(key):
+    """Returns an incremental HMAC-SHA256 object; feed chunks with update() and finish with digest()."""
+    return hmac.new(key.encode('utf-8'), digestmod=hashlib.sha256)
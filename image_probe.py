@@ -0,0 +1,66 @@
+import os
+from collections import namedtuple
+from functools import lru_cache
+
+from PIL import Image
+
+PROBE_CACHE_SIZE = 64  # Image files whose header facts are kept
+
+# Bits per sample for the modes that are not 8-bit
+MODE_BITS = {"1": 1, "I": 32, "F": 32, "I;16": 16, "I;16B": 16, "I;16L": 16, "I;16N": 16}
+
+class ImageInfo(namedtuple("ImageInfo", ["path", "width", "height", "mode", "format", "bits", "color_mode",
+                                         "file_size"])):
+    """Header facts about an image: dimensions, mode, format, bits per sample and the mode the payload uses."""
+    __slots__ = ()
+
+    @property
+    def size(self):
+        return self.width, self.height
+
+    @property
+    def pixel_count(self):
+        return self.width * self.height
+
+    @property
+    def channel_count(self):
+        return len(self.color_mode)
+
+def color_mode(img):
+    """Return 'RGBA' if the image has transparency, otherwise 'RGB'."""
+    has_alpha = img.mode in ('RGBA', 'LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info)
+    return 'RGBA' if has_alpha else 'RGB'
+
+def _info(img, path, file_size):
+    width, height = img.size
+    return ImageInfo(path, width, height, img.mode, img.format, MODE_BITS.get(img.mode, 8), color_mode(img),
+                     file_size)
+
+@lru_cache(maxsize=PROBE_CACHE_SIZE)
+def _probe(path, mtime_ns, file_size):
+    # Image.open only parses the header; the pixel data is never decoded here
+    try:
+        with Image.open(path) as img:
+            return _info(img, path, file_size)
+    except OSError as e:
+        raise ValueError(f"Error loading image: {e}")
+
+def probe_image(path):
+    """Reads the header of an image file and returns its ImageInfo.
+
+    Results are cached by path, modification time and size, so repeated
+    probes of an unchanged file (capacity checks, property panels, the
+    encode itself) cost a single stat call.
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    return _probe(path, stat.st_mtime_ns, stat.st_size)
+
+def image_info(image):
+    """Return the ImageInfo for a file path, an ImageInfo or an open PIL image."""
+    if isinstance(image, ImageInfo):
+        return image
+    if not isinstance(image, Image.Image):
+        return probe_image(image)
+    path = getattr(image, "filename", "") or None
+    return _info(image, path, os.path.getsize(path) if path else None)
@@ -0,0 +1,204 @@
+# instrument.py - opt-in wall time, CPU time and peak memory per pipeline stage
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_active = None  # The Profile currently recording, if any
+_DISABLED = nullcontext()
+
+def _max_rss():
+    """Return the process's resident memory high-water mark in bytes, or None where it is unavailable."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+class StageStats:
+    """Totals for one stage: calls, wall and CPU seconds, and memory in bytes (see Profile)."""
+    __slots__ = ("calls", "wall", "cpu", "peak", "rss_growth")
+
+    def __init__(self):
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.peak = None
+        self.rss_growth = None
+
+class Profile:
+    """Context manager that records every instrumented stage run inside it.
+
+    Stages are timed in wall and CPU (process) seconds. With memory=True,
+    tracemalloc also records how far each stage pushed Python and NumPy
+    allocations above where they stood when it began (peak); tracing slows
+    allocation-heavy code down, so pass memory=False for timings alone.
+    Pillow keeps decoded pixels outside tracemalloc's view, so where the OS
+    reports it the growth of the process's peak resident memory is also
+    recorded (rss_growth); it is only nonzero for a stage that set a new
+    high-water mark. Nested stages are counted in their parents too.
+    callback(name, wall, cpu, peak) is called as each stage finishes. Only
+    one profile records at a time, and stages are expected to run on one
+    thread.
+
+        with Profile() as profile:
+            hide_file(...)
+        print(profile.summary())
+    """
+
+    def __init__(self, memory=True, callback=None):
+        self.memory = memory
+        self.callback = callback
+        self.stages = {}
+        self._stack = []  # [allocated at start, highest peak of finished children] per open stage
+        self._pulls = []  # [wall, cpu] spent in nested timed iterators, per chunk being produced
+        self._tracing = False
+
+    def __enter__(self):
+        global _active
+        if _active is not None:
+            raise ValueError("Another profile is already recording.")
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+        _active = self
+        return self
+
+    def __exit__(self, *exc_info):
+        global _active
+        _active = None
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+
+    @contextmanager
+    def stage(self, name):
+        stats = self.stages.setdefault(name, StageStats())
+        frame = None
+        if self.memory:
+            # The peak is about to be reset for this stage, so hand the parent what it has reached so far
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                self._stack[-1][1] = max(self._stack[-1][1], peak)
+            tracemalloc.reset_peak()
+            frame = [current, current]
+            self._stack.append(frame)
+        start_rss = _max_rss()
+        start_wall, start_cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - start_wall, time.process_time() - start_cpu
+            peak = None
+            if frame is not None:
+                self._stack.pop()
+                highest = max(tracemalloc.get_traced_memory()[1], frame[1])
+                if self._stack:
+                    self._stack[-1][1] = max(self._stack[-1][1], highest)
+                peak = highest - frame[0]
+                stats.peak = max(stats.peak or 0, peak)
+            if start_rss is not None:
+                stats.rss_growth = max(stats.rss_growth or 0, _max_rss() - start_rss)
+            stats.calls += 1
+            stats.wall += wall
+            stats.cpu += cpu
+            if self.callback is not None:
+                self.callback(name, wall, cpu, peak)
+
+    def timed_chunks(self, name, chunks):
+        """Yields from chunks, adding the time spent producing each one to the named stage (see timed_chunks)."""
+        stats = self.stages.setdefault(name, StageStats())
+        iterator = iter(chunks)
+        wall = cpu = 0.0
+        try:
+            while True:
+                self._pulls.append([0.0, 0.0])
+                start_wall, start_cpu = time.perf_counter(), time.process_time()
+                try:
+                    chunk = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    spent_wall, spent_cpu = time.perf_counter() - start_wall, time.process_time() - start_cpu
+                    nested_wall, nested_cpu = self._pulls.pop()
+                    wall += spent_wall - nested_wall
+                    cpu += spent_cpu - nested_cpu
+                    if self._pulls:
+                        self._pulls[-1][0] += spent_wall
+                        self._pulls[-1][1] += spent_cpu
+                yield chunk
+        finally:
+            stats.calls += 1
+            stats.wall += wall
+            stats.cpu += cpu
+            if self.callback is not None:
+                self.callback(name, wall, cpu, None)
+
+    def merge(self, stages):
+        """Adds the stage totals of another profile's as_dict(), e.g. one recorded in a worker process."""
+        for name, totals in stages.items():
+            stats = self.stages.setdefault(name, StageStats())
+            stats.calls += totals["calls"]
+            stats.wall += totals["wall"]
+            stats.cpu += totals["cpu"]
+            if totals["peak_bytes"] is not None:
+                stats.peak = max(stats.peak or 0, totals["peak_bytes"])
+            if totals["rss_growth_bytes"] is not None:
+                stats.rss_growth = max(stats.rss_growth or 0, totals["rss_growth_bytes"])
+
+    def walls(self):
+        """Return the wall seconds of each stage, in the order the stages first ran."""
+        return {name: s.wall for name, s in self.stages.items()}
+
+    def as_dict(self):
+        """Return the stage totals as plain dicts, in the order the stages first ran."""
+        return {name: {"calls": s.calls, "wall": s.wall, "cpu": s.cpu, "peak_bytes": s.peak,
+                       "rss_growth_bytes": s.rss_growth}
+                for name, s in self.stages.items()}
+
+    def summary(self):
+        """Return the stage totals as a printable table."""
+        lines = [f"{'stage':<16}{'calls':>6}{'wall ms':>12}{'cpu ms':>12}{'peak MB':>10}{'RSS +MB':>10}"]
+        for name, s in self.stages.items():
+            memory = "".join(f"{value / 2 ** 20:10.1f}" if value is not None else f"{'-':>10}"
+                             for value in (s.peak, s.rss_growth))
+            lines.append(f"{name:<16}{s.calls:>6}{s.wall * 1000:12.2f}{s.cpu * 1000:12.2f}{memory}")
+        return "\n".join(lines)
+
+def stage(name):
+    """Return a context manager that records a stage in the active profile; does nothing when none is active."""
+    if _active is None:
+        return _DISABLED
+    return _active.stage(name)
+
+def timed_chunks(name, chunks):
+    """Wrap a lazy stream of chunks so the time spent producing them is recorded as the named stage.
+
+    Streamed stages such as encrypt and hmac run a piece at a time inside
+    whichever stage pulls the chunks, so they cannot be wrapped in stage().
+    Time spent in a timed iterator further up the stream is left to that
+    iterator's stage, keeping e.g. decrypt apart from reading the pixels;
+    all of it still counts toward the stage that pulls the chunks. Each
+    iterator counts as one call and no memory is recorded for it. Returns
+    chunks unchanged when no profile is active.
+    """
+    if _active is None:
+        return chunks
+    return _active.timed_chunks(name, chunks)
+
+def instrumented(name):
+    """Decorator recording every call of a function as the named stage while a profile is active."""
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if _active is None:
+                return func(*args, **kwargs)
+            with _active.stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
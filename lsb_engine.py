@@ -0,0 +1,409 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
+
+# Channel letters in pixel-array order
+CHANNEL_NAMES = "RGBA"
+BLUE = (2,)
+STRIP_ROWS = 256  # Rows copied out of a PIL image at a time for keyed-order reads
+STREAM_PIXELS = 1 << 16  # Pixels per chunk of a streamed payload; a multiple of 8, so chunks are whole bytes
+SCATTER_CACHE_BYTES = 128 << 20  # Most memory kept by cached scatter orders between calls
+
+class ScatterOrder:
+    """Keyed pseudo-random permutation of pixel indices 0..pixel_count-1.
+
+    A 4-round Feistel network over the smallest even-width bit domain that
+    covers pixel_count, with cycle-walking to stay in range, all vectorized
+    in NumPy. Slot i always maps to the same pixel, so only the prefix a
+    payload needs is computed, and it is kept (read-only) for later calls on
+    the same instance. Instances are shared through scatter_order's cache,
+    so extending the prefix is locked.
+    """
+
+    ROUNDS = 4
+
+    def __init__(self, key, pixel_count):
+        self.round_keys = _round_keys(key)
+        self.pixel_count = pixel_count
+        self.half_bits = max(1, ((pixel_count - 1).bit_length() + 1) // 2)
+        self._order = np.empty(0, dtype=np.int64)
+        self._lock = threading.Lock()
+
+    def _permute(self, values):
+        half_mask = np.uint64((1 << self.half_bits) - 1)
+        shift = np.uint64(self.half_bits)
+        left, right = values >> shift, values & half_mask
+        for round_key in self.round_keys[:self.ROUNDS]:
+            mixed = (right ^ round_key) * np.uint64(0xFF51AFD7ED558CCD)
+            mixed ^= mixed >> np.uint64(33)
+            left, right = right, left ^ (mixed & half_mask)
+        return (left << shift) | right
+
+    def positions(self, first, count):
+        """Return the pixel indices for slots first..first+count-1 without caching them."""
+        if first + count > self.pixel_count:
+            raise ValueError("Message is too large to fit in the image.")
+        positions = self._permute(np.arange(first, first + count, dtype=np.uint64))
+        outside = positions >= self.pixel_count
+        while outside.any():
+            positions[outside] = self._permute(positions[outside])
+            outside = positions >= self.pixel_count
+        return positions.view(np.int64)
+
+    def take(self, count):
+        """Return the pixel indices for the first count slots (a read-only array)."""
+        order = self._order
+        if count > len(order):
+            with self._lock:
+                order = self._order
+                if count > len(order):
+                    order = np.concatenate((order, self.positions(len(order), count - len(order))))
+                    order.flags.writeable = False
+                    self._order = order
+        return order[:count]
+
+    @property
+    def nbytes(self):
+        """Bytes held by the computed prefix."""
+        return self._order.nbytes
+
+    def window(self, first):
+        """Return an order whose slot 0 is slot first of this one, for chunked streams."""
+        return ScatterWindow(self, first)
+
+class ScatterWindow:
+    """The slots of a ScatterOrder from a given slot on.
+
+    Only the indices of the current chunk are computed and kept, so a streamed
+    payload never holds the order of all its pixels at once.
+    """
+
+    def __init__(self, order, first):
+        self.order = order
+        self.first = first
+        self._positions = np.empty(0, dtype=np.int64)
+
+    def take(self, count):
+        """Return the pixel indices for the first count slots of the window."""
+        if count > len(self._positions):
+            self._positions = self.order.positions(self.first, count)
+        return self._positions[:count]
+
+@lru_cache(maxsize=32)
+def _round_keys(key):
+    """Return the read-only Feistel round keys for a key (bytes); 32 bytes each, so cheap to cache."""
+    digest = hashlib.sha256(b"lsb-scatter:" + key).digest()
+    round_keys = np.frombuffer(digest, dtype=">u8").astype(np.uint64)
+    round_keys.flags.writeable = False
+    return round_keys
+
+_scatter_cache = OrderedDict()  # (key, pixel count) -> ScatterOrder, least recently used first
+_scatter_lock = threading.Lock()
+
+def scatter_order(key, pixel_count):
+    """Return the ScatterOrder for a key (str or bytes) and pixel count.
+
+    Orders are cached per (key, pixel count), so a batch reusing one key on
+    same-sized images computes the permutation once. The least recently used
+    orders are dropped while the cache holds more than SCATTER_CACHE_BYTES;
+    an order that was dropped keeps working for whoever still holds it.
+    """
+    if isinstance(key, str):
+        key = key.encode("utf-8")
+    with _scatter_lock:
+        order = _scatter_cache.pop((key, pixel_count), None) or ScatterOrder(key, pixel_count)
+        _scatter_cache[key, pixel_count] = order
+        # Prefixes grow after they are handed out, so the size is checked on the next call
+        total = sum(cached.nbytes for cached in _scatter_cache.values())
+        while total > SCATTER_CACHE_BYTES and len(_scatter_cache) > 1:
+            total -= _scatter_cache.popitem(last=False)[1].nbytes
+    return order
+
+def bytes_to_bits(data):
+    """Unpacks bytes into an array of bits (MSB first)."""
+    return np.unpackbits(np.frombuffer(data, dtype=np.uint8))
+
+def channel_indices(channels):
+    """Converts channel letters such as "RGB" into pixel-array indices."""
+    indices = []
+    for name in channels.upper():
+        if name not in CHANNEL_NAMES or CHANNEL_NAMES.index(name) in indices:
+            raise ValueError(f"Invalid channel selection: {channels}")
+        indices.append(CHANNEL_NAMES.index(name))
+    if not indices:
+        raise ValueError("At least one channel must be selected.")
+    return tuple(sorted(indices))
+
+def mask_to_indices(channel_mask):
+    """Converts a channel bit mask into pixel-array indices."""
+    return tuple(i for i in range(len(CHANNEL_NAMES)) if channel_mask >> i & 1)
+
+def indices_to_mask(indices):
+    """Converts pixel-array indices into a channel bit mask."""
+    return sum(1 << i for i in indices)
+
+def pixels_needed(bit_count, channels=BLUE, depth=1):
+    """Return how many pixels hold bit_count bits with the given layout."""
+    slots = -(-bit_count // depth)
+    return -(-slots // len(channels))
+
+def _pack_values(bits, depth):
+    """Groups bits into depth-bit values (MSB first), zero-padding the last group."""
+    if depth == 1:
+        return bits
+    padded = np.zeros(-(-len(bits) // depth) * depth, dtype=np.uint8)
+    padded[:len(bits)] = bits
+    shifts = np.arange(depth - 1, -1, -1, dtype=np.uint8)
+    return (padded.reshape(-1, depth) << shifts).sum(axis=1, dtype=np.uint8)
+
+def _unpack_values(values, depth):
+    """Splits depth-bit values back into bits (MSB first)."""
+    if depth == 1:
+        return values
+    shifts = np.arange(depth - 1, -1, -1, dtype=np.uint8)
+    return ((values[:, None] >> shifts) & 1).reshape(-1)
+
+def header_channels(channel_count):
+    """Return the channel holding the payload header: blue, or the only channel of a gray image."""
+    return (min(2, channel_count - 1),)
+
+def _row_band(pixels, start, end):
+    """Return (band, first_row, offset): the rows covering pixels [start, end) flattened to (N, C).
+
+    The band is a view when the rows are contiguous in memory and a copy of
+    just those rows otherwise (e.g. bottom-up or padded memory-mapped files).
+    """
+    width = pixels.shape[1]
+    first_row, last_row = start // width, (end - 1) // width + 1
+    band = pixels[first_row:last_row].reshape(-1, pixels.shape[2])
+    return band, first_row, start - first_row * width
+
+def _slot_values(bits, channels, depth):
+    """Packs a bit stream into one row of channel values per pixel.
+
+    Returns (values, valid) arrays of shape (pixels, channels); valid is False
+    for the unused channels of a partly filled last pixel.
+    """
+    values = _pack_values(bits, depth)
+    pixel_count = pixels_needed(len(bits), channels, depth)
+    padded = np.zeros(pixel_count * len(channels), dtype=np.uint8)
+    padded[:len(values)] = values
+    valid = np.arange(len(padded)) < len(values)
+    return padded.reshape(pixel_count, -1), valid.reshape(pixel_count, -1)
+
+def _sort_by_pixel(positions):
+    """Return (positions sorted, their slots): one sort of (pixel << 32 | slot) keys, much cheaper than argsort."""
+    keys = np.sort(positions << 32 | np.arange(len(positions), dtype=np.int64))
+    return keys >> 32, keys & 0xFFFFFFFF
+
+class ScatteredBits:
+    """A keyed-order bit stream, packed into channel values once and sorted by pixel index.
+
+    Writing it strip by strip then costs one binary search per strip to find
+    the slice of pixels inside it, rather than a pass over the whole payload.
+    """
+
+    def __init__(self, bits, start, channels, depth, order):
+        values, valid = _slot_values(bits, channels, depth)
+        positions = start + order.take(len(values))
+        self.positions, by_pixel = _sort_by_pixel(positions)
+        # A pixel's channel values travel as one uint32, which gathers far faster than rows of bytes
+        words = np.zeros((len(values), 4), dtype=np.uint8)
+        words[:, :len(channels)] = values
+        self.values = words.view(np.uint32).reshape(-1)[by_pixel]
+        self.channels = channels
+        self.depth = depth
+        # Only the last pixel can be partly filled; its unused channels are left as they were
+        unused = [channel for channel, used in zip(channels, valid[-1]) if not used] if len(valid) else []
+        self.partial = (int(positions[-1]), unused) if unused else None
+
+    def write_window(self, pixels, window_start=0):
+        """Writes the bits that fall inside an (H, W, C) window whose first pixel has global index window_start."""
+        width = pixels.shape[1]
+        window_end = window_start + pixels.shape[0] * width
+        first, last = np.searchsorted(self.positions, (window_start, window_end))
+        if first == last:
+            return
+        rows, cols = np.divmod(self.positions[first:last] - window_start, width)
+        values = self.values[first:last].view(np.uint8).reshape(-1, 4)
+
+        kept = None
+        if self.partial is not None and window_start <= self.partial[0] < window_end:
+            row, col = divmod(self.partial[0] - window_start, width)
+            kept = pixels[row, col, self.partial[1]].copy()
+        keep = 0xFF ^ ((1 << self.depth) - 1)
+        for i, channel in enumerate(self.channels):
+            pixels[rows, cols, channel] = (pixels[rows, cols, channel] & keep) | values[:, i]
+        if kept is not None:
+            pixels[row, col, self.partial[1]] = kept
+
+def write_bits(pixels, bits, start=0, channels=BLUE, depth=1, order=None):
+    """Writes bits into the low bits of an (H, W, C) array, starting at a pixel index.
+
+    Bits are spread over the selected channels of each pixel in turn, depth
+    bits per channel. Only the rows that hold the bits are touched. With a
+    ScatterOrder, consecutive pixels of the stream are start + order.take(n)
+    instead of start, start + 1, ...
+    """
+    height, width, channel_count = pixels.shape
+    slots = -(-len(bits) // depth)
+    end = start + pixels_needed(len(bits), channels, depth)
+    if end > width * height:
+        raise ValueError("Message is too large to fit in the image.")
+    if max(channels) >= channel_count:
+        raise ValueError("Image does not have the channels to write to.")
+    if not len(bits):
+        return
+    if order is not None:
+        ScatteredBits(bits, start, channels, depth, order).write_window(pixels)
+        return
+
+    band, first_row, offset = _row_band(pixels, start, end)
+    flat = band[offset:offset + end - start]
+    keep = 0xFF ^ ((1 << depth) - 1)
+    if len(channels) == 1:
+        flat[:, channels[0]] = (flat[:, channels[0]] & keep) | _pack_values(bits, depth)
+    else:
+        region = flat[:, channels].reshape(-1)
+        region[:slots] = (region[:slots] & keep) | _pack_values(bits, depth)
+        flat[:, channels] = region.reshape(-1, len(channels))
+
+    # Copy the rows back when the band could not be a view
+    if not np.may_share_memory(band, pixels):
+        pixels[first_row:first_row + len(band) // width] = band.reshape(-1, width, channel_count)
+
+def write_bits_window(pixels, bits, start, channels, depth, window_start, order=None):
+    """Writes the part of a bit stream that falls inside a window of pixels.
+
+    The stream starts at global pixel index start; pixels is an (H, W, C) strip
+    whose first pixel has global index window_start. To write a scattered
+    stream into many windows, build one ScatteredBits and reuse it instead.
+    """
+    if order is not None:
+        ScatteredBits(bits, start, channels, depth, order).write_window(pixels, window_start)
+        return
+    bits_per_pixel = len(channels) * depth
+    window_end = window_start + pixels.shape[0] * pixels.shape[1]
+    first = max(start, window_start)
+    last = min(start + pixels_needed(len(bits), channels, depth), window_end)
+    if first >= last:
+        return
+    window_bits = bits[(first - start) * bits_per_pixel:(last - start) * bits_per_pixel]
+    write_bits(pixels, window_bits, first - window_start, channels, depth)
+
+def _values_to_bytes(values, bit_count, depth):
+    """Packs the low-bit values read from the pixels back into bytes."""
+    values = values[:-(-bit_count // depth)] & ((1 << depth) - 1)
+    return np.packbits(_unpack_values(values, depth)[:bit_count]).tobytes()
+
+def read_array_bytes(pixels, start, count, channels=BLUE, depth=1, order=None):
+    """Reads count bytes from the low bits of an (H, W, C) array, starting at a pixel index.
+
+    Only the rows holding the requested pixels are read (or, with a
+    ScatterOrder, only the pixels it visits).
+    """
+    if count == 0:
+        return b""
+    height, width, channel_count = pixels.shape
+    bit_count = count * 8
+    end = start + pixels_needed(bit_count, channels, depth)
+    if end > width * height:
+        raise ValueError("Image is too small to hold the requested data.")
+    if max(channels) >= channel_count:
+        raise ValueError("Image does not have the channels the payload was written to.")
+
+    if order is not None:
+        rows, cols = np.divmod(start + order.take(end - start), width)
+        return _values_to_bytes(pixels[rows, cols][:, channels].reshape(-1), bit_count, depth)
+
+    band, _, offset = _row_band(pixels, start, end)
+    return _values_to_bytes(band[offset:offset + end - start][:, channels].reshape(-1), bit_count, depth)
+
+def read_bytes(img, start, count, channels=BLUE, depth=1, order=None):
+    """Reads count bytes from the low bits of a PIL image, starting at a pixel index."""
+    if count == 0:
+        return b""
+    width, height = img.size
+    end = start + pixels_needed(count * 8, channels, depth)
+    if end > width * height:
+        raise ValueError("Image is too small to hold the requested data.")
+
+    if order is not None:
+        # Visit the image one strip at a time; sorted targets give each strip its own slice
+        targets, by_pixel = _sort_by_pixel(start + order.take(end - start))
+        tops = range(0, height, STRIP_ROWS)
+        bounds = np.searchsorted(targets, np.array([*tops, height], dtype=np.int64) * width)
+        values = np.empty((len(targets), len(channels)), dtype=np.uint8)
+        for top, first, last in zip(tops, bounds, bounds[1:]):
+            if first < last:
+                band = np.asarray(img.crop((0, top, width, min(top + STRIP_ROWS, height))))
+                if max(channels) >= band.shape[2]:
+                    raise ValueError("Image does not have the channels the payload was written to.")
+                flat, local = band.reshape(-1, band.shape[2]), targets[first:last] - top * width
+                slots = by_pixel[first:last]
+                # One channel at a time: 1-D gathers are much faster than gathering rows of bytes
+                for i, channel in enumerate(channels):
+                    values[slots, i] = flat[local, channel]
+        return _values_to_bytes(values.reshape(-1), count * 8, depth)
+
+    # Only the rows holding the requested pixels are copied out of the image
+    first_row, last_row = start // width, (end - 1) // width + 1
+    band = np.asarray(img.crop((0, first_row, width, last_row)))
+    return read_array_bytes(band, start - first_row * width, count, channels, depth)
+
+def rechunk(chunks, size):
+    """Regroups an iterable of byte strings into pieces of exactly size bytes (the last may be shorter)."""
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += chunk
+        while len(buffer) >= size:
+            yield bytes(buffer[:size])
+            del buffer[:size]
+    if buffer:
+        yield bytes(buffer)
+
+def stream_chunk_size(channels=BLUE, depth=1):
+    """Return the bytes held by STREAM_PIXELS pixels with the given layout."""
+    return STREAM_PIXELS * len(channels) * depth // 8
+
+def write_stream(pixels, chunks, start=0, channels=BLUE, depth=1, order=None, count=None, progress=None):
+    """Writes an iterable of byte chunks into an (H, W, C) array like write_bits; returns the bytes written.
+
+    The chunks are regrouped into pieces of STREAM_PIXELS pixels and written
+    one after another, so only one piece is ever unpacked into bits. With a
+    progress hook, progress(pixels done, pixels total) is called after each
+    piece; count is then the total number of bytes in the chunks.
+    """
+    total = pixels_needed(count * 8, channels, depth) if progress is not None else 0
+    written = 0
+    for index, chunk in enumerate(rechunk(chunks, stream_chunk_size(channels, depth))):
+        offset = index * STREAM_PIXELS
+        if order is None:
+            write_bits(pixels, bytes_to_bits(chunk), start + offset, channels, depth)
+        else:
+            write_bits(pixels, bytes_to_bits(chunk), start, channels, depth, order.window(offset))
+        written += len(chunk)
+        if progress is not None:
+            progress(min(offset + STREAM_PIXELS, total), total)
+    return written
+
+def iter_read(read, start, count, channels=BLUE, depth=1, order=None, progress=None):
+    """Yields count bytes through read(start, count, channels, depth, order), STREAM_PIXELS pixels at a time.
+
+    With a progress hook, progress(pixels done, pixels total) is called after each piece is read.
+    """
+    step = stream_chunk_size(channels, depth)
+    total = pixels_needed(count * 8, channels, depth)
+    for offset in range(0, count, step):
+        pixel_offset = offset // step * STREAM_PIXELS
+        size = min(step, count - offset)
+        if order is None:
+            chunk = read(start + pixel_offset, size, channels, depth, None)
+        else:
+            chunk = read(start, size, channels, depth, order.window(pixel_offset))
+        if progress is not None:
+            progress(min(pixel_offset + STREAM_PIXELS, total), total)
+        yield chunk
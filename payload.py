@@ -0,0 +1,150 @@
+import struct
+from collections import namedtuple
+
+# Container layout: header, then one (type, length, value) record per field
+MAGIC = b"\x89STG"  # 0x89 never occurs in the legacy base64 text stream
+VERSION = 2
+HEADER = struct.Struct(">4sBBBBI")  # magic, version, flags, channel mask, bits per channel, body length
+HEADER_V1 = struct.Struct(">4sBBI")  # magic, version, flags, body length (blue channel, 1 bit)
+HEADER_SIZE = HEADER.size  # Bytes to read before the version is known
+FIELD = struct.Struct(">BI")  # field type, value length
+
+# Header flags
+FLAG_SCATTER = 0x01  # Body pixels follow a keyed pseudo-random order
+FLAG_BINARY = 0x02  # Ciphertext and MAC fields hold raw bytes instead of base64/hex text
+FLAG_AEAD = 0x04  # Ciphertext field is AES-GCM nonce + ciphertext + tag; there is no MAC field
+FLAG_BOUND = 0x08  # Fields other than key, ciphertext and MAC (file name, codec, KDF) are authenticated with it
+
+# Channel mask bits, one per channel index
+CHANNEL_BLUE = 0b0100
+CHANNEL_RGB = 0b0111
+CHANNEL_ALL = 0b1111  # R, G, B and A; higher bits name no channel
+
+# Field types
+FIELD_CIPHERTEXT = 1
+FIELD_MAC = 2
+FIELD_KEY = 3
+FIELD_KDF = 4  # Key derivation function name; absent means single SHA-256
+FIELD_FILENAME = 5  # UTF-8 base name of a hidden file
+FIELD_FILE_SIZE = 6  # Size of a hidden file in bytes (unsigned 64-bit, big-endian)
+FIELD_COMPRESSION = 7  # Codec the plaintext was compressed with before encryption (e.g. b"zlib")
+
+Header = namedtuple("Header", ["version", "flags", "channel_mask", "depth", "body_length", "size"])
+
+def pack_header(body_length, flags=0, channel_mask=CHANNEL_RGB, depth=1):
+    """Builds the header for a container body of the given length."""
+    return HEADER.pack(MAGIC, VERSION, flags, channel_mask, depth, body_length)
+
+def pack_payload(fields, flags=0, channel_mask=CHANNEL_RGB, depth=1):
+    """Builds a container from a {field type: bytes} mapping."""
+    body = b"".join(FIELD.pack(field_type, len(value)) + value for field_type, value in fields.items())
+    return pack_header(len(body), flags, channel_mask, depth) + body
+
+def stream_body_length(fields):
+    """Return the body length of a container streamed from (field type, length, chunks) triples."""
+    return sum(FIELD.size + length for _, length, _ in fields)
+
+def iter_body(fields):
+    """Yields a container body from (field type, length, chunks) triples without joining the values.
+
+    Fields are written in the given order; chunks may be a lazy iterator, so a
+    field can depend on values streamed before it (e.g. a MAC).
+    """
+    for field_type, length, chunks in fields:
+        yield FIELD.pack(field_type, length)
+        written = 0
+        for chunk in chunks:
+            written += len(chunk)
+            yield chunk
+        if written != length:
+            raise ValueError(f"Field {field_type} produced {written} bytes, expected {length}.")
+
+def is_payload(data):
+    """Return True if the data starts with a container header."""
+    return data[:len(MAGIC)] == MAGIC
+
+def unpack_header(data):
+    """Parses a container header into a Header record."""
+    if len(data) < HEADER_V1.size or not is_payload(data):
+        raise ValueError("Data does not start with a valid payload header.")
+    version = data[len(MAGIC)]
+    if version == 1:
+        _, version, flags, body_length = HEADER_V1.unpack_from(data)
+        return Header(version, flags, CHANNEL_BLUE, 1, body_length, HEADER_V1.size)
+    if version != VERSION or len(data) < HEADER.size:
+        raise ValueError(f"Unsupported payload version: {version}")
+    _, version, flags, channel_mask, depth, body_length = HEADER.unpack_from(data)
+    if not channel_mask or channel_mask & ~CHANNEL_ALL or not 1 <= depth <= 4:
+        raise ValueError("Payload header has an invalid channel layout.")
+    return Header(version, flags, channel_mask, depth, body_length, HEADER.size)
+
+def unpack_fields(body):
+    """Parses a container body into a {field type: bytes} mapping."""
+    fields = {}
+    offset = 0
+    while offset < len(body):
+        if offset + FIELD.size > len(body):
+            raise ValueError("Payload field header is truncated.")
+        field_type, length = FIELD.unpack_from(body, offset)
+        offset += FIELD.size
+        if offset + length > len(body):
+            raise ValueError("Payload field value is truncated.")
+        fields[field_type] = bytes(body[offset:offset + length])
+        offset += length
+    return fields
+
+class _ChunkReader:
+    """Reads exact byte counts from an iterable of byte chunks."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = bytearray()
+
+    def _fill(self, size):
+        for chunk in self._chunks:
+            self._buffer += chunk
+            if len(self._buffer) >= size:
+                break
+        return len(self._buffer) >= size
+
+    def at_end(self):
+        return not self._fill(1)
+
+    def read(self, size, error="Payload field value is truncated."):
+        if not self._fill(size):
+            raise ValueError(error)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def iter_read(self, size):
+        """Yields the next size bytes as they arrive."""
+        while size:
+            if not self._buffer and not self._fill(1):
+                raise ValueError("Payload field value is truncated.")
+            piece = bytes(self._buffer[:size])
+            del self._buffer[:len(piece)]
+            size -= len(piece)
+            yield piece
+
+def iter_fields(chunks):
+    """Parses a container body streamed as byte chunks, yielding (field type, length, value chunks).
+
+    Each value iterator reads straight from the stream; whatever is left of it
+    is skipped when the next field is requested.
+    """
+    reader = _ChunkReader(chunks)
+    while not reader.at_end():
+        field_type, length = FIELD.unpack(reader.read(FIELD.size, "Payload field header is truncated."))
+        value = reader.iter_read(length)
+        yield field_type, length, value
+        for _ in value:
+            pass
+
+def unpack_payload(data):
+    """Parses a complete container and returns (flags, fields)."""
+    header = unpack_header(data)
+    body = data[header.size:header.size + header.body_length]
+    if len(body) < header.body_length:
+        raise ValueError("Payload body is truncated.")
+    return header.flags, unpack_fields(body)
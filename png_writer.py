@@ -0,0 +1,68 @@
+import struct
+import zlib
+
+import numpy as np
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+COLOR_TYPES = {"L": 0, "RGB": 2, "LA": 4, "RGBA": 6}
+
+class PNGStreamWriter:
+    """Writes an 8-bit PNG strip by strip, so the full image never has to be in memory.
+
+    Rows are Sub-filtered with NumPy and fed through one zlib stream; only the
+    current strip and the compressor state are held at any time.
+    """
+
+    def __init__(self, path, width, height, mode, compress_level=6):
+        if mode not in COLOR_TYPES:
+            raise ValueError(f"Unsupported PNG mode: {mode}")
+        self.width = width
+        self.height = height
+        self.channels = len(mode)
+        self.rows_written = 0
+        self._compressor = zlib.compressobj(compress_level)
+        self._file = open(path, "wb")
+        self._file.write(PNG_SIGNATURE)
+        self._chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, COLOR_TYPES[mode], 0, 0, 0))
+
+    def _chunk(self, tag, data):
+        self._file.write(struct.pack(">I", len(data)) + tag + data)
+        self._file.write(struct.pack(">I", zlib.crc32(tag + data)))
+
+    def write_rows(self, rows):
+        """Appends an (N, width, channels) uint8 array of rows."""
+        rows = np.asarray(rows, dtype=np.uint8).reshape(len(rows), self.width * self.channels)
+        if self.rows_written + len(rows) > self.height:
+            raise ValueError("More rows written than the image height.")
+
+        # Sub filter: each byte minus the same channel of the pixel to its left
+        lines = np.empty((len(rows), rows.shape[1] + 1), dtype=np.uint8)
+        lines[:, 0] = 1
+        lines[:, 1:] = rows
+        lines[:, 1 + self.channels:] -= rows[:, :-self.channels]
+
+        compressed = self._compressor.compress(lines.tobytes())
+        if compressed:
+            self._chunk(b"IDAT", compressed)
+        self.rows_written += len(rows)
+
+    def close(self):
+        """Finishes the PNG stream; every row must have been written."""
+        if self._file.closed:
+            return
+        try:
+            if self.rows_written != self.height:
+                raise ValueError(f"Only {self.rows_written} of {self.height} rows were written.")
+            self._chunk(b"IDAT", self._compressor.flush())
+            self._chunk(b"IEND", b"")
+        finally:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._file.close()
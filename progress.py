@@ -0,0 +1,43 @@
+import threading
+import time
+
+class Cancelled(Exception):
+    """Raised from a progress hook to stop an operation that was cancelled."""
+
+class ProgressTracker:
+    """Progress hook for the engines, with an ETA and a cancel flag.
+
+    Pass it as progress= to the encode/decode functions, which call it with
+    (pixels done, pixels total). Reports are forwarded to callback(done,
+    total, eta_seconds) at most every interval seconds, and always at the
+    end. cancel() may be called from any thread; the next hook call then
+    raises Cancelled inside the engine.
+    """
+
+    def __init__(self, callback=None, interval=0.1):
+        self.callback = callback
+        self.interval = interval
+        self._cancelled = threading.Event()
+        self._first = None  # (time, done) of the first report, the baseline for the rate
+        self._last = 0.0
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def __call__(self, done, total):
+        if self._cancelled.is_set():
+            raise Cancelled("The operation was cancelled.")
+        now = time.perf_counter()
+        if self._first is None:
+            self._first = (now, done)
+        if self.callback is None or (done < total and now - self._last < self.interval):
+            return
+        self._last = now
+        # Rate measured from the first report, so setup such as decoding the image does not skew it
+        start, first_done = self._first
+        eta = (now - start) / (done - first_done) * (total - done) if done > first_done else None
+        self.callback(done, total, eta)
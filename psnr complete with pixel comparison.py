@@ -1,47 +1,18 @@
 import cv2
-import numpy as np
-from skimage.metrics import structural_similarity as ssim
 import tkinter as tk
 from tkinter import filedialog, Label, Button, messagebox
 from matplotlib import pyplot as plt
 from datetime import datetime
+import json
 import os
 from PIL import Image, ImageTk, ImageGrab
 
-def mse(imageA, imageB):
-    """Calculate the Mean Squared Error between two images."""
-    err = np.sum((imageA.astype("float") - imageB.astype("float")) ** 2)
-    err /= float(imageA.shape[0] * imageA.shape[1])
-    return err
-
-def psnr(imageA, imageB):
-    """Calculate the Peak Signal-to-Noise Ratio between two images."""
-    mse_value = mse(imageA, imageB)
-    if mse_value == 0:
-        return float('inf')
-    return 20 * np.log10(255.0 / np.sqrt(mse_value))
-
-def normalized_cross_correlation(imageA, imageB):
-    """Calculate Normalized Cross-Correlation between two images."""
-    return np.sum((imageA - np.mean(imageA)) * (imageB - np.mean(imageB))) / (np.std(imageA) * np.std(imageB) * imageA.size)
-
-def entropy(image):
-    """Calculate the entropy of an image."""
-    hist, _ = np.histogram(image.ravel(), bins=256, range=(0, 256))
-    hist = hist / hist.sum()
-    entropy_value = -np.sum(hist * np.log2(hist + 1e-10))  # Add epsilon to avoid log(0)
-    return entropy_value
+from quality_metrics import QUALITY_RANGES, compare_arrays, diff_summary, load_rgb, pixel_diff, save_pixel_diff
 
 def compare_images(imageA, imageB):
-    """Compare two images and compute MSE, PSNR, SSIM, NCC, and entropy difference."""
-    grayA = cv2.cvtColor(imageA, cv2.COLOR_BGR2GRAY)
-    grayB = cv2.cvtColor(imageB, cv2.COLOR_BGR2GRAY)
-    m = mse(grayA, grayB)
-    p = psnr(grayA, grayB)
-    s = ssim(grayA, grayB)
-    ncc = normalized_cross_correlation(grayA, grayB)
-    entropy_diff = abs(entropy(grayA) - entropy(grayB))
-    return m, p, s, ncc, entropy_diff
+    """Compare two RGB images and compute MSE, PSNR, SSIM, NCC, and entropy difference."""
+    # One fused, chunked pass over the uint8 arrays on their luma (see quality_metrics.py)
+    return tuple(compare_arrays(imageA, imageB))
 
 def file_size(filepath):
     """Get file size in bytes."""
@@ -83,14 +54,8 @@ def display_graphs(mse_value, psnr_value, ssim_value, ncc_value, entropy_diff, o
     metrics = ['MSE', 'PSNR', 'SSIM', 'NCC', 'Entropy Diff']
     values = [mse_value, psnr_value, ssim_value, ncc_value, entropy_diff]
 
-    # Define ranges for qualitative analysis of metrics
-    ranges = {
-        'MSE': {'Perfect': (0, 0.1), 'Good Quality': (0.1, 1), 'Poor Quality': (1, float('inf'))},
-        'PSNR': {'Excellent Quality': (40, float('inf')), 'Good Quality': (30, 40), 'Poor Quality': (0, 30)},
-        'SSIM': {'Perfect Similarity': (1, 1), 'Excellent Similarity': (0.9, 1), 'Moderate Similarity': (0.7, 0.9), 'Low Similarity': (0, 0.7)},
-        'NCC': {'Perfect Similarity': (1, 1), 'Excellent Similarity': (0.9, 1), 'Moderate Similarity': (0.7, 0.9), 'Low Similarity': (0, 0.7)},
-        'Entropy Diff': {'Very Similar': (0, 0.5), 'Similar': (0.5, 1), 'Dissimilar': (1, float('inf'))}
-    }
+    # Ranges for qualitative analysis of metrics, shared with the headless report (see quality_metrics.py)
+    ranges = dict(zip(metrics, QUALITY_RANGES.values()))
 
     # Set figure size to 19.2 x 10.8 inches for fullscreen appearance
     fig, ax = plt.subplots(figsize=(19.2, 10.8))  # Fullscreen aspect ratio 16:9
@@ -260,8 +225,8 @@ def show_graph():
         messagebox.showwarning("Warning", "No images selected to display graph.")
 
 
-def save_pixel_comparison(original_image, modified_image, original_path, modified_path):
-    """Save RGB pixel values comparison of the original and modified images to a text file."""
+def save_pixel_comparison(original_image, modified_image, original_path, modified_path, diff_format="npz"):
+    """Save the changed pixels of the modified image (npz or csv) and a per-channel summary (JSON)."""
     # Create subfolder for results if it doesn't exist
     original_name = os.path.splitext(os.path.basename(original_path))[0]
     modified_name = os.path.splitext(os.path.basename(modified_path))[0]
@@ -273,30 +238,20 @@ def save_pixel_comparison(original_image, modified_image, original_path, modifie
     results_dir = os.path.join(current_dir, "result and analysis pictures", subfolder_name)
     os.makedirs(results_dir, exist_ok=True)
 
-    # Define the path for the text file
-    text_file_path = os.path.join(results_dir, f"pixel_comparison_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt")
+    # Only changed pixels are written: their row, column and values in both images
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    diff_file_path = os.path.join(results_dir, f"pixel_diff_{stamp}.{diff_format}")
+    summary_file_path = os.path.join(results_dir, f"pixel_diff_{stamp}_summary.json")
 
-    # Get the dimensions of the images
-    height, width, _ = original_image.shape
-    
-    with open(text_file_path, 'w') as f:
-        f.write("Original (R,G,B)\tModified (R,G,B)\n")  # Header for the file
-        for y in range(height):
-            for x in range(width):
-                # Get pixel values for original and modified images
-                orig_pixel = tuple(original_image[y, x])
-                mod_pixel = tuple(modified_image[y, x])
-                
-                # Determine if the pixel value has changed
-                if orig_pixel != mod_pixel:
-                    f.write(f"({orig_pixel[0]},{orig_pixel[1]},{orig_pixel[2]} Changed)\t"
-                            f"({mod_pixel[0]},{mod_pixel[1]},{mod_pixel[2]})\n")
-                else:
-                    # Write unchanged pixel values as is
-                    f.write(f"({orig_pixel[0]},{orig_pixel[1]},{orig_pixel[2]})\t"
-                            f"({mod_pixel[0]},{mod_pixel[1]},{mod_pixel[2]})\n")
-
-    messagebox.showinfo("Success", f"Pixel comparison saved successfully to:\n{text_file_path}")
+    diff = pixel_diff(original_image, modified_image)
+    save_pixel_diff(diff, diff_file_path)
+    summary = diff_summary(diff)
+    with open(summary_file_path, 'w') as f:
+        json.dump(summary, f, indent=2)
+
+    per_channel = ", ".join(f"{name}: {counts['changed']}" for name, counts in summary["channels"].items())
+    messagebox.showinfo("Success", f"{summary['changed_pixels']} of {summary['pixels']} pixels changed ({per_channel}).\n"
+                                   f"Pixel comparison saved successfully to:\n{diff_file_path}")
 
 
 def save_results_button():
@@ -306,8 +261,8 @@ def save_results_button():
         histogram_fig, metrics_fig = load_and_compare_images(original_path, modified_path)[:2]
         save_results(original_path, modified_path, histogram_fig, metrics_fig)  # Save figures and screen capture
         # Add call to save pixel comparison
-        original_image = cv2.imread(original_path)
-        modified_image = cv2.imread(modified_path)
+        original_image = load_rgb(original_path)
+        modified_image = load_rgb(modified_path)
         save_pixel_comparison(original_image, modified_image, original_path, modified_path)  # Call new function
         messagebox.showinfo("Success", "Results saved successfully!")
     else:
@@ -0,0 +1,248 @@
+# quality_metrics.py - fused, chunked image comparison metrics (NumPy only, no GUI or plotting imports)
+import math
+import os
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import numpy as np
+from PIL import Image
+
+CHUNK_PIXELS = 1 << 19  # Pixels per band of rows processed at a time
+
+# SSIM constants, matching skimage.metrics.structural_similarity defaults for uint8 images
+SSIM_WINDOW = 7
+SSIM_K1 = 0.01
+SSIM_K2 = 0.03
+DATA_RANGE = 255
+
+# ITU-R BT.601 luma in 15-bit fixed point, the same weights and rounding OpenCV uses for RGB to gray
+GRAY_WEIGHTS = (9798, 19235, 3735)
+GRAY_SHIFT = 15
+
+_GRAY_WEIGHTS = np.array(GRAY_WEIGHTS, dtype=np.float32)
+_VALUES = np.arange(256, dtype=np.int64)
+_SQUARES = _VALUES * _VALUES
+
+Metrics = namedtuple("Metrics", ["mse", "psnr", "ssim", "ncc", "entropy_diff"])
+
+# Qualitative bands for each metric, checked in order; the first that holds the value names it
+QUALITY_RANGES = {
+    "mse": {'Perfect': (0, 0.1), 'Good Quality': (0.1, 1), 'Poor Quality': (1, float('inf'))},
+    "psnr": {'Excellent Quality': (40, float('inf')), 'Good Quality': (30, 40), 'Poor Quality': (0, 30)},
+    "ssim": {'Perfect Similarity': (1, 1), 'Excellent Similarity': (0.9, 1), 'Moderate Similarity': (0.7, 0.9), 'Low Similarity': (0, 0.7)},
+    "ncc": {'Perfect Similarity': (1, 1), 'Excellent Similarity': (0.9, 1), 'Moderate Similarity': (0.7, 0.9), 'Low Similarity': (0, 0.7)},
+    "entropy_diff": {'Very Similar': (0, 0.5), 'Similar': (0.5, 1), 'Dissimilar': (1, float('inf'))},
+}
+
+def quality_label(metric, value):
+    """Return the qualitative label of a metric value (a Metrics field name), or 'Out of Range'."""
+    for label, (min_val, max_val) in QUALITY_RANGES[metric].items():
+        if min_val <= value <= max_val:
+            return label
+    return "Out of Range"
+
+def to_gray(image):
+    """Converts an (H, W, 3/4) RGB(A) uint8 array to (H, W) uint8 luma; gray arrays pass through."""
+    if image.ndim == 2:
+        return image
+    # The weighted sum stays below 2**24, so float32 holds it exactly and the shift becomes a floor
+    gray = image[..., :3].astype(np.float32) @ _GRAY_WEIGHTS
+    gray += 1 << (GRAY_SHIFT - 1)
+    gray *= 1.0 / (1 << GRAY_SHIFT)
+    return np.floor(gray, out=gray).astype(np.uint8)
+
+def _box_sums(values, window):
+    """Sums of every window x window block of a 2-D int32 array, via running sums.
+
+    The running sums may wrap around int32, but every block sum fits, so
+    the differences between them are still exact.
+    """
+    height, width = values.shape
+    running = np.zeros((height + 1, width), dtype=np.int32)
+    np.cumsum(values, axis=0, dtype=np.int32, out=running[1:])
+    columns = running[window:] - running[:-window]
+
+    running = np.zeros((height - window + 1, width + 1), dtype=np.int32)
+    np.cumsum(columns, axis=1, dtype=np.int32, out=running[:, 1:])
+    return running[:, window:] - running[:, :-window]
+
+def _ssim_sum(a, b, ab, window=SSIM_WINDOW):
+    """Sum of the SSIM map over every full window x window block of two int32 gray bands.
+
+    Same map as skimage's structural_similarity with a uniform window and
+    sample covariance, whose mean also skips the border half a window wide.
+    With window sums S the means are S / n and the sample (co)variances are
+    (n * S_xy - S_x * S_y) / (n * (n - 1)); those factors cancel in the SSIM
+    ratio, so everything up to the final ratio is exact int32 arithmetic.
+    """
+    n = window * window
+    c1 = (SSIM_K1 * DATA_RANGE) ** 2 * n * n
+    c2 = (SSIM_K2 * DATA_RANGE) ** 2 * n * (n - 1)
+    sum_a, sum_b = _box_sums(a, window), _box_sums(b, window)
+    # Only the sum of the two variances is needed, and box sums are linear
+    squares = _box_sums(a * a + b * b, window)
+    cross = sum_a * sum_b
+    means = sum_a * sum_a + sum_b * sum_b
+
+    numerator = (2 * cross).astype(np.float32)
+    numerator += c1
+    covariance = (2 * (n * _box_sums(ab, window) - cross)).astype(np.float32)
+    covariance += c2
+    numerator *= covariance
+
+    denominator = means.astype(np.float32)
+    denominator += c1
+    variances = (n * squares - means).astype(np.float32)
+    variances += c2
+    denominator *= variances
+    numerator /= denominator
+    return float(numerator.sum(dtype=np.float64))
+
+def _entropy(histogram):
+    p = histogram[histogram > 0] / histogram.sum()
+    return float(-np.sum(p * np.log2(p)))
+
+def _band(imageA, imageB, top, bottom, window):
+    """Accumulators for rows top:bottom: (histogram A, histogram B, sum of A*B, SSIM sum, windows)."""
+    height, width = imageA.shape[:2]
+    # The band plus the rows that the SSIM windows starting in it reach into
+    reach = min(bottom + window - 1, height)
+    windows = max(reach - top - window + 1, 0) * (width - window + 1)
+    raw_a, raw_b = imageA[top:reach], imageB[top:reach]
+    own = bottom - top
+
+    gray_a = to_gray(raw_a)
+    if np.array_equal(raw_a, raw_b):
+        # Identical rows: one histogram, and every window has an SSIM of exactly 1
+        hist = np.bincount(gray_a[:own].ravel(), minlength=256)
+        return hist, hist, int(hist @ _SQUARES), float(windows), windows
+
+    gray_b = to_gray(raw_b)
+    a = gray_a.astype(np.int32)
+    b = gray_b.astype(np.int32)
+    ab = a * b
+    hist_a = np.bincount(gray_a[:own].ravel(), minlength=256)
+    hist_b = np.bincount(gray_b[:own].ravel(), minlength=256)
+    ssim = _ssim_sum(a, b, ab, window) if windows else 0.0
+    return hist_a, hist_b, int(ab[:own].sum(dtype=np.int64)), ssim, windows
+
+def compare_arrays(imageA, imageB, chunk_pixels=CHUNK_PIXELS, workers=None):
+    """Computes MSE, PSNR, SSIM, NCC and entropy difference of two images in one pass.
+
+    The images are uint8 arrays of the same shape, RGB(A) or gray; color
+    images are compared on their luma, as the analysis tool always has. The
+    rows are split into bands of about chunk_pixels pixels, each converted
+    to gray once and reduced to exact integer accumulators (histograms and
+    the A*B sum, from which MSE, NCC and entropy follow) plus the SSIM
+    windows starting in it. Bands whose rows are identical in both images
+    skip the SSIM arithmetic. Bands run on a pool of worker threads
+    (default: CPU count) since NumPy releases the GIL, and memory stays
+    bounded by a few bands per worker. Returns a Metrics tuple.
+    """
+    if imageA.shape != imageB.shape:
+        raise ValueError("Images must have the same dimensions to be compared.")
+    height, width = imageA.shape[:2]
+    window = SSIM_WINDOW
+    if height < window or width < window:
+        raise ValueError(f"Images must be at least {window}x{window} pixels to compute SSIM.")
+
+    rows = max(1, chunk_pixels // width)
+    tops = range(0, height, rows)
+    band = partial(_band, imageA, imageB, window=window)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(tops) == 1:
+        bands = [band(top, min(top + rows, height)) for top in tops]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            bands = list(executor.map(lambda top: band(top, min(top + rows, height)), tops))
+
+    hist_a = sum(b[0] for b in bands)
+    hist_b = sum(b[1] for b in bands)
+    sum_ab = sum(b[2] for b in bands)
+    ssim = sum(b[3] for b in bands) / sum(b[4] for b in bands)
+
+    # Every other moment follows from the exact histograms
+    count = height * width
+    sum_a, sum_b = int(hist_a @ _VALUES), int(hist_b @ _VALUES)
+    sum_aa, sum_bb = int(hist_a @ _SQUARES), int(hist_b @ _SQUARES)
+    mse = (sum_aa + sum_bb - 2 * sum_ab) / count
+    psnr = float("inf") if mse == 0 else 20 * math.log10(DATA_RANGE / math.sqrt(mse))
+
+    # Pearson correlation
+    spread = (count * sum_aa - sum_a * sum_a) * (count * sum_bb - sum_b * sum_b)
+    ncc = (count * sum_ab - sum_a * sum_b) / math.sqrt(spread) if spread else float("nan")
+
+    return Metrics(mse, psnr, ssim, ncc, abs(_entropy(hist_a) - _entropy(hist_b)))
+
+def load_rgb(path):
+    """Loads an image file as an (H, W, 3) uint8 RGB array."""
+    with Image.open(path) as img:
+        return np.asarray(img.convert("RGB") if img.mode != "RGB" else img)
+
+def compare_files(original_path, modified_path, chunk_pixels=CHUNK_PIXELS, workers=None):
+    """compare_arrays on two image files."""
+    return compare_arrays(load_rgb(original_path), load_rgb(modified_path), chunk_pixels, workers)
+
+# Changed pixels between two images, in row-major order
+PixelDiff = namedtuple("PixelDiff", ["shape", "rows", "cols", "original", "modified"])
+
+CHANNEL_NAMES = {1: "L", 2: "LA", 3: "RGB", 4: "RGBA"}
+
+def pixel_diff(imageA, imageB, chunk_pixels=CHUNK_PIXELS):
+    """Finds the pixels that differ between two uint8 images of the same shape.
+
+    Returns a PixelDiff with the row and column of every changed pixel and
+    its (N, C) values in both images. The mask is built one band of rows at
+    a time, so memory and output grow with the number of changes, not the
+    image size.
+    """
+    if imageA.shape != imageB.shape:
+        raise ValueError("Images must have the same dimensions to be compared.")
+    if imageA.ndim == 2:
+        imageA, imageB = imageA[..., None], imageB[..., None]
+    height, width, channels = imageA.shape
+
+    rows = max(1, chunk_pixels // width)
+    found = []
+    for top in range(0, height, rows):
+        a, b = imageA[top:top + rows], imageB[top:top + rows]
+        # Changed bytes, then the distinct pixels they fall in (flatnonzero keeps them sorted)
+        pixels = np.flatnonzero(a != b) // channels
+        pixels = pixels[np.r_[True, pixels[1:] != pixels[:-1]]] if len(pixels) else pixels
+        band_rows, band_cols = np.divmod(pixels, width)
+        found.append((band_rows.astype(np.uint32) + top, band_cols.astype(np.uint32),
+                      a[band_rows, band_cols], b[band_rows, band_cols]))
+    return PixelDiff(imageA.shape, *(np.concatenate(parts) for parts in zip(*found)))
+
+def diff_summary(diff):
+    """Return changed-pixel counts overall and per channel, with each channel's largest change."""
+    height, width, channels = diff.shape
+    changed = diff.original != diff.modified
+    delta = np.abs(diff.modified.astype(np.int16) - diff.original)
+    names = CHANNEL_NAMES.get(channels) or [str(i) for i in range(channels)]
+    return {
+        "width": width,
+        "height": height,
+        "pixels": width * height,
+        "changed_pixels": len(diff.rows),
+        "changed_fraction": len(diff.rows) / (width * height),
+        "channels": {
+            name: {"changed": int(changed[:, i].sum()), "max_abs_diff": int(delta[:, i].max(initial=0))}
+            for i, name in enumerate(names)
+        },
+    }
+
+def save_pixel_diff(diff, path):
+    """Writes the changed pixels to a compressed .npz archive or a .csv file, chosen by extension."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".npz":
+        np.savez_compressed(path, shape=np.array(diff.shape), rows=diff.rows, cols=diff.cols,
+                            original=diff.original, modified=diff.modified)
+    elif extension == ".csv":
+        names = CHANNEL_NAMES.get(diff.shape[2]) or [str(i) for i in range(diff.shape[2])]
+        header = ",".join(["row", "col"] + [f"original_{n}" for n in names] + [f"modified_{n}" for n in names])
+        table = np.column_stack([diff.rows, diff.cols, diff.original, diff.modified])
+        np.savetxt(path, table, fmt="%d", delimiter=",", header=header, comments="")
+    else:
+        raise ValueError(f"Unsupported pixel diff format: {extension} (use .npz or .csv)")
@@ -0,0 +1,89 @@
+# quality_report.py - tables and plots for batch quality reports (headless; matplotlib only for plots)
+import csv
+import importlib.util
+import json
+import math
+import os
+
+from quality_metrics import Metrics
+
+REPORT_COLUMNS = (["original", "stego", "status", "width", "height", "original_size", "stego_size"]
+                  + list(Metrics._fields) + ["changed_pixels", "changed_fraction"]
+                  + [f"{name}_quality" for name in Metrics._fields] + ["error"])
+
+REPORT_FORMATS = (".csv", ".json")
+
+# Per-pair values drawn as distributions, with their axis labels
+PLOTTED = (("mse", "MSE"), ("psnr", "PSNR (dB)"), ("ssim", "SSIM"), ("ncc", "NCC"),
+           ("entropy_diff", "Entropy difference"), ("changed_fraction", "Fraction of pixels changed"))
+
+def report_rows(results):
+    """Flatten analyze_job results into rows holding REPORT_COLUMNS; failed pairs keep only their error."""
+    return [{column: result.get(column) for column in REPORT_COLUMNS} for result in results]
+
+def write_report(results, path):
+    """Writes one row per pair to a .csv or .json table, chosen by extension.
+
+    Identical pairs have an infinite PSNR, written as inf in CSV and as
+    Infinity in JSON (which Python's json module reads back).
+    """
+    extension = os.path.splitext(path)[1].lower()
+    rows = report_rows(results)
+    if extension == ".csv":
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=REPORT_COLUMNS)
+            writer.writeheader()
+            writer.writerows(rows)
+    elif extension == ".json":
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=1)
+    else:
+        raise ValueError(f"Unsupported report format: {extension} (use {' or '.join(REPORT_FORMATS)})")
+
+def can_plot():
+    """Return True if matplotlib is installed, so plot_report can run."""
+    return importlib.util.find_spec("matplotlib") is not None
+
+def plot_report(results, output_dir):
+    """Renders the metric distributions and PSNR against changed pixels as PNGs; returns their paths.
+
+    Figures are drawn on matplotlib's Agg canvas without pyplot, so no
+    window or display is ever needed.
+    """
+    try:
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+    except ImportError:
+        raise ValueError("Plots need matplotlib: pip install matplotlib")
+
+    succeeded = [r for r in results if r["status"] == "ok"]
+    if not succeeded:
+        raise ValueError("No pairs were analyzed successfully, so there is nothing to plot.")
+    os.makedirs(output_dir, exist_ok=True)
+
+    figure = Figure(figsize=(15, 8))
+    FigureCanvasAgg(figure)
+    figure.suptitle(f"Quality metrics over {len(succeeded)} image pairs", fontsize=16)
+    for i, (key, label) in enumerate(PLOTTED):
+        ax = figure.add_subplot(2, 3, i + 1)
+        # Identical pairs have an infinite PSNR, which a histogram cannot place
+        values = [r[key] for r in succeeded if math.isfinite(r[key])]
+        ax.hist(values, bins=min(50, max(len(values), 1)), color="steelblue")
+        ax.set_xlabel(label)
+        ax.set_ylabel("Pairs")
+    figure.tight_layout(rect=[0, 0, 1, 0.95])
+    distribution_path = os.path.join(output_dir, "metric_distributions.png")
+    figure.savefig(distribution_path)
+
+    figure = Figure(figsize=(10, 6))
+    FigureCanvasAgg(figure)
+    ax = figure.add_subplot()
+    finite = [r for r in succeeded if math.isfinite(r["psnr"])]
+    ax.scatter([r["changed_fraction"] for r in finite], [r["psnr"] for r in finite], s=8, alpha=0.6)
+    ax.set_xlabel("Fraction of pixels changed")
+    ax.set_ylabel("PSNR (dB)")
+    ax.set_title("PSNR against embedding footprint")
+    figure.tight_layout()
+    scatter_path = os.path.join(output_dir, "psnr_vs_changed.png")
+    figure.savefig(scatter_path)
+    return [distribution_path, scatter_path]
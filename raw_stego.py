@@ -0,0 +1,158 @@
+import os
+import struct
+from functools import partial
+
+import numpy as np
+
+from decode_lsb import read_payload, read_payload_stream
+from encode_lsb import layers_end, payload_layers, write_payload_stream
+from lsb_engine import header_channels, read_array_bytes, write_bits
+
+# Formats whose pixels sit at fixed file offsets and can be edited in place
+RAW_EXTENSIONS = (".raw", ".rgb", ".rgba")
+HEADER_READ_SIZE = 4096  # Enough for BMP headers and commented PPM/PGM headers
+
+def _ppm_layout(head):
+    """Parses a binary PPM (P6) or PGM (P5) header and returns the pixel layout."""
+    tokens = []
+    offset = 2
+    while len(tokens) < 3:
+        # Skip whitespace and comments between header tokens
+        while head[offset:offset + 1].isspace():
+            offset += 1
+        if head[offset:offset + 1] == b"#":
+            offset = head.find(b"\n", offset) + 1
+            continue
+        end = offset
+        while head[end:end + 1].isdigit():
+            end += 1
+        if end == offset:
+            raise ValueError("Malformed PPM/PGM header.")
+        tokens.append(int(head[offset:end]))
+        offset = end
+    width, height, maxval = tokens
+    if maxval != 255:
+        raise ValueError("Only 8-bit PPM/PGM files are supported.")
+    channels = 3 if head[:2] == b"P6" else 1
+    # A single whitespace byte separates the header from the pixel data
+    return {"offset": offset + 1, "width": width, "height": height, "channels": channels,
+            "stride": width * channels, "bottom_up": False, "bgr": False}
+
+def _bmp_layout(head):
+    """Parses an uncompressed 24/32-bit BMP header and returns the pixel layout."""
+    pixel_offset, = struct.unpack_from("<I", head, 10)
+    width, height, _, bits_per_pixel, compression = struct.unpack_from("<iiHHI", head, 18)
+    if compression != 0 or bits_per_pixel not in (24, 32):
+        raise ValueError("Only uncompressed 24-bit and 32-bit BMP files are supported.")
+    # Rows are padded to 4 bytes; positive heights are stored bottom-up
+    return {"offset": pixel_offset, "width": width, "height": abs(height), "channels": bits_per_pixel // 8,
+            "stride": (bits_per_pixel * width + 31) // 32 * 4, "bottom_up": height > 0, "bgr": True}
+
+def _layout(head, path, width, height, channels):
+    """Return the pixel layout of a BMP, PPM/PGM or raw file from its first bytes."""
+    if head[:2] == b"BM":
+        return _bmp_layout(head)
+    if head[:2] in (b"P5", b"P6"):
+        return _ppm_layout(head)
+    if os.path.splitext(path)[1].lower() in RAW_EXTENSIONS or width:
+        if not width or not height:
+            raise ValueError("Width and height are required for raw pixel files.")
+        return {"offset": 0, "width": width, "height": height, "channels": channels,
+                "stride": width * channels, "bottom_up": False, "bgr": False}
+    raise ValueError("Unsupported file: expected BMP, PPM/PGM or raw pixels.")
+
+def open_pixels(path, writable=False, width=None, height=None, channels=3):
+    """Memory-maps a BMP, PPM/PGM or raw file and returns (pixels, mapped).
+
+    pixels is a zero-copy (H, W, C) top-down, RGB-ordered view whose writes
+    go straight to the file; call mapped.flush() to force them to disk. Raw
+    files have no header, so their width, height and channel count must be
+    given.
+    """
+    with open(path, "rb") as f:
+        head = f.read(HEADER_READ_SIZE)
+    layout = _layout(head, path, width, height, channels)
+    mapped = np.memmap(path, dtype=np.uint8, mode="r+" if writable else "r", offset=layout["offset"],
+                       shape=(layout["height"], layout["stride"]))
+    return _pixels(mapped, layout), mapped
+
+def _pixels(data, layout):
+    """Return the top-down, RGB-ordered (H, W, C) view of stored rows of pixel data (H, stride)."""
+    pixels = data[:, :layout["width"] * layout["channels"]].reshape(len(data), layout["width"], -1)
+    if layout["bottom_up"]:
+        pixels = pixels[::-1]
+    if layout["bgr"]:
+        # BGR(X) -> RGB; a fourth BMP byte is usually unused padding
+        pixels = pixels[:, :, 2::-1]
+    return pixels
+
+def row_reader(path):
+    """Return read(top, bottom): rows [top, bottom) of a BMP or PPM/PGM file as a new (N, W, C) array.
+
+    The rows are top-down and RGB-ordered as with open_pixels, but are read
+    with plain file reads, so rows read earlier do not stay resident the way
+    the pages of a memory map do.
+    """
+    with open(path, "rb") as f:
+        head = f.read(HEADER_READ_SIZE)
+    layout = _layout(head, path, None, None, 3)
+    height, stride = layout["height"], layout["stride"]
+
+    def read(top, bottom):
+        # A bottom-up file stores the requested rows in reverse, starting from the far end
+        first = height - bottom if layout["bottom_up"] else top
+        with open(path, "rb") as f:
+            f.seek(layout["offset"] + first * stride)
+            data = np.fromfile(f, dtype=np.uint8, count=(bottom - top) * stride)
+        if len(data) != (bottom - top) * stride:
+            raise ValueError("The image file is truncated.")
+        return np.ascontiguousarray(_pixels(data.reshape(bottom - top, stride), layout))
+    return read
+
+def encode_raw(path, fields, flags=0, channels=None, depth=1, width=None, height=None, raw_channels=3,
+               scatter_key=None):
+    """Encodes a payload container into an uncompressed image file in place.
+
+    Only the LSBs of the pixels that carry the payload are flipped, through a
+    memory map; the rest of the file is never read or copied.
+    """
+    pixels, mapped = open_pixels(path, True, width, height, raw_channels)
+    pixel_count = pixels.shape[0] * pixels.shape[1]
+    layers = payload_layers(fields, flags, channels, depth, pixels.shape[2], pixel_count, scatter_key)
+    if layers_end(layers) > pixel_count:
+        raise ValueError("Message is too large to fit in the image.")
+    for bits, start, indices, bit_depth, order in layers:
+        write_bits(pixels, bits, start, indices, bit_depth, order)
+    mapped.flush()
+
+def decode_raw(path, width=None, height=None, raw_channels=3, scatter_key=None):
+    """Decodes the payload container of an uncompressed image file and returns (flags, fields).
+
+    The header is read first and then exactly the pages holding the body.
+    """
+    pixels, _ = open_pixels(path, False, width, height, raw_channels)
+    decoded = read_payload(partial(read_array_bytes, pixels), pixels.shape[0] * pixels.shape[1],
+                           header_channels(pixels.shape[2]), scatter_key)
+    if decoded is None:
+        raise ValueError("No payload found in the image.")
+    return decoded
+
+def encode_raw_stream(path, fields, flags=0, channels=None, depth=1, width=None, height=None, raw_channels=3,
+                      scatter_key=None):
+    """Encodes a container streamed from (field type, length, chunks) triples into a file in place.
+
+    Combined with envelope.seal_stream this hides a file of any size with
+    memory bounded by one chunk: neither the payload nor the image is loaded.
+    """
+    pixels, mapped = open_pixels(path, True, width, height, raw_channels)
+    write_payload_stream(pixels, fields, flags, channels, depth, scatter_key)
+    mapped.flush()
+
+def decode_raw_stream(path, width=None, height=None, raw_channels=3, scatter_key=None):
+    """Decodes the container of an uncompressed image file lazily and returns (flags, body chunks)."""
+    pixels, _ = open_pixels(path, False, width, height, raw_channels)
+    decoded = read_payload_stream(partial(read_array_bytes, pixels), pixels.shape[0] * pixels.shape[1],
+                                  header_channels(pixels.shape[2]), scatter_key)
+    if decoded is None:
+        raise ValueError("No payload found in the image.")
+    return decoded
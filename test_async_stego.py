@@ -0,0 +1,83 @@
+# test_async_stego.py - many concurrent small embed/extract requests through the asyncio facade
+import asyncio
+import io
+import os
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from async_stego import AsyncStego
+
+AES_KEY = "Sixteen byte key"
+HMAC_KEY = "DemoHMACKey-1-ForTestingPurposes"
+
+class CountingExecutor(ThreadPoolExecutor):
+    """Thread pool that records the most jobs it ever ran at once."""
+
+    def __init__(self, max_workers):
+        super().__init__(max_workers=max_workers)
+        self._lock = threading.Lock()
+        self.in_flight = self.max_in_flight = 0
+
+    def submit(self, fn, *args, **kwargs):
+        def counted():
+            with self._lock:
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            try:
+                # Hold each job briefly so queued requests pile up against the limit
+                time.sleep(0.005)
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.in_flight -= 1
+        return super().submit(counted)
+
+def cover_png(width=96, height=96):
+    pixels = np.random.default_rng(0).integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+class ConcurrentRequestsTest(unittest.TestCase):
+    REQUESTS = 60
+    MAX_CONCURRENT = 3
+
+    def setUp(self):
+        # More threads than the limit, so only AsyncStego's semaphore can hold jobs back
+        self.executor = CountingExecutor(max_workers=self.MAX_CONCURRENT * 4)
+        self.stego = AsyncStego(self.executor, self.MAX_CONCURRENT)
+        self.cover = cover_png()
+        self.messages = [os.urandom(1 + i * 7 % 200) for i in range(self.REQUESTS)]
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    async def _round_trip(self):
+        stego_images = await asyncio.gather(*(
+            self.stego.embed(self.cover, message, AES_KEY, HMAC_KEY, compress_level=1) for message in self.messages))
+        return await asyncio.gather(*(self.stego.extract(image, AES_KEY, HMAC_KEY) for image in stego_images))
+
+    def test_results_match_and_concurrency_is_bounded(self):
+        decoded = asyncio.run(self._round_trip())
+        self.assertEqual(decoded, self.messages)
+        self.assertLessEqual(self.executor.max_in_flight, self.MAX_CONCURRENT)
+        self.assertGreater(self.executor.max_in_flight, 1)
+
+    def test_file_objects_and_reuse_across_event_loops(self):
+        message = b"file-like message"
+        image = asyncio.run(self.stego.embed(io.BytesIO(self.cover), io.BytesIO(message), AES_KEY, HMAC_KEY))
+        # A second asyncio.run is a new event loop; the instance must not reuse the old loop's semaphore
+        self.assertEqual(asyncio.run(self.stego.extract(io.BytesIO(image), AES_KEY, HMAC_KEY)), message)
+
+    def test_wrong_key_fails(self):
+        image = asyncio.run(self.stego.embed(self.cover, b"secret", AES_KEY, HMAC_KEY))
+        with self.assertRaises(ValueError):
+            asyncio.run(self.stego.extract(image, AES_KEY, "another HMAC key"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+# test_envelope.py - the codec and KDF fields are authenticated along with the ciphertext
+import unittest
+
+from aes import KDF_PBKDF2
+from compression import COMPRESSION_ZLIB
+from envelope import CIPHERS, open_sealed, open_sealed_stream, seal, seal_stream
+from payload import FIELD_COMPRESSION, FIELD_KDF, FLAG_BOUND, iter_body
+
+AES_KEY = "Sixteen byte key"
+HMAC_KEY = "DemoHMACKey-1-ForTestingPurposes"
+MESSAGE = b"A message that compresses well. " * 64
+
+# Ways to tamper with a payload's settings after it was sealed
+TAMPERING = {
+    "codec stripped": (FIELD_COMPRESSION, None),
+    "codec swapped": (FIELD_COMPRESSION, b"lzma"),
+    "kdf stripped": (FIELD_KDF, None),
+    "kdf swapped": (FIELD_KDF, b"scrypt"),
+}
+
+def tampered_fields(fields, field_type, value):
+    """Return a {field type: bytes} copy with one field replaced, or removed when value is None."""
+    fields = dict(fields)
+    if value is None:
+        del fields[field_type]
+    else:
+        fields[field_type] = value
+    return fields
+
+def open_streamed(flags, fields, field_type=None, value=None):
+    """Tamper with (field type, length, chunks) triples as tampered_fields does, then open them streamed."""
+    changed = []
+    for triple in fields:
+        if triple[0] != field_type:
+            changed.append(triple)
+        elif value is not None:
+            changed.append((field_type, len(value), [value]))
+    body = b"".join(iter_body(changed))
+    return b"".join(open_sealed_stream(flags, [body], AES_KEY, HMAC_KEY))
+
+class BoundSettingsTest(unittest.TestCase):
+    def test_tampered_settings_fail(self):
+        for cipher in CIPHERS:
+            flags, fields = seal(MESSAGE, AES_KEY, HMAC_KEY, cipher, COMPRESSION_ZLIB, kdf=KDF_PBKDF2)
+            self.assertTrue(flags & FLAG_BOUND)
+            self.assertEqual(open_sealed(flags, fields, AES_KEY, HMAC_KEY), MESSAGE)
+            for name, (field_type, value) in TAMPERING.items():
+                with self.subTest(cipher=cipher, tampering=name), self.assertRaises(ValueError):
+                    open_sealed(flags, tampered_fields(fields, field_type, value), AES_KEY, HMAC_KEY)
+            with self.subTest(cipher=cipher, tampering="flag cleared"), self.assertRaises(ValueError):
+                open_sealed(flags & ~FLAG_BOUND, fields, AES_KEY, HMAC_KEY)
+
+    def test_tampered_streamed_settings_fail(self):
+        for cipher in CIPHERS:
+            def sealed():
+                return seal_stream([MESSAGE], len(MESSAGE), AES_KEY, HMAC_KEY, cipher, COMPRESSION_ZLIB,
+                                   KDF_PBKDF2)
+            self.assertEqual(open_streamed(*sealed()), MESSAGE)
+            for name, (field_type, value) in TAMPERING.items():
+                with self.subTest(cipher=cipher, tampering=name), self.assertRaises(ValueError):
+                    open_streamed(*sealed(), field_type, value)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,18 @@
+# test_payload.py - container headers with a channel mask outside R, G, B and A are rejected
+import unittest
+
+from payload import CHANNEL_ALL, CHANNEL_RGB, pack_header, unpack_header
+
+class ChannelMaskTest(unittest.TestCase):
+    def test_valid_masks_parse(self):
+        for mask in (CHANNEL_RGB, CHANNEL_ALL, 0b0001):
+            with self.subTest(mask=bin(mask)):
+                self.assertEqual(unpack_header(pack_header(10, channel_mask=mask)).channel_mask, mask)
+
+    def test_unknown_channel_bits_fail(self):
+        for mask in (0, 0x10, 0x80, CHANNEL_RGB | 0x20, 0xFF):
+            with self.subTest(mask=bin(mask)), self.assertRaises(ValueError):
+                unpack_header(pack_header(10, channel_mask=mask))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,10 @@
 import os
 from PIL import Image
 
+from capacity import plan
+from envelope import CIPHER_GCM
+from image_probe import image_info
+
 def load_image(image_path):
     """Load an image from the specified file path."""
     try:
@@ -9,24 +13,23 @@ def load_image(image_path):
         raise ValueError(f"Error loading image: {e}")
 
 def calculate_image_properties(image):
-    """Calculate and return properties of the image."""
-    width, height = image.size
-    size = os.path.getsize(image.filename) / 1024  # Size in KB
-    resolution = f"{width} x {height}"
-    num_pixels = width * height
+    """Calculate and return properties of the image (a path, an ImageInfo or a PIL image)."""
+    info = image_info(image)  # Header only, cached per file
     return {
-        "size": size,
-        "resolution": resolution,
-        "num_pixels": num_pixels
+        "size": info.file_size / 1024,  # Size in KB
+        "resolution": f"{info.width} x {info.height}",
+        "num_pixels": info.pixel_count,
+        "mode": info.mode,
+        "format": info.format,
+        "bits": info.bits
     }
 
-def can_message_fit(image, message):
-    """Check if the message can fit in the image based on its pixel count."""
-    width, height = image.size
-    num_pixels = width * height
-    # Each pixel can hold 3 bits (one for each RGB channel)
-    max_message_length = num_pixels * 3 // 8  # Convert bits to bytes
-    return len(message) <= max_message_length
+def can_message_fit(image, message, channels=None, depth=1, cipher=CIPHER_GCM, key_length=16):
+    """Check if the encrypted message, with all of its payload overhead, can fit in the image."""
+    info = image_info(image)
+    # Only the dimensions and mode are needed, never the pixel data
+    return plan(info.width, info.height, len(message.encode('utf-8')), channels, depth, cipher,
+                info.channel_count, key_length).fits
 
 def get_image_extension(image_path):
     """Return the file extension of the image."""